@@ -9,8 +9,7 @@ setup(
     install_requires=[
         'pycryptodome>=3.9',
         'dill',
-        'bchlib',
-        'sqlitedict'
+        'bchlib'
     ],
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -0,0 +1,551 @@
+'''
+SQLiteFS Benchmarks
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import os
+import random
+from os import urandom, cpu_count
+from time import perf_counter
+from tempfile import TemporaryDirectory
+from contextlib import contextmanager
+from dill import dumps
+from .dope import DOPE2, CONTAINER, unpack_packet, byte_xor, byte_and
+from .keyring import KeyContext
+
+
+def timed(func, rounds: int) -> float:
+    '''
+    Mean wall time of a call
+    Args:
+        func: callable - Zero argument callable
+        rounds: int - Number of calls
+
+    Returns:
+        float - Seconds per call
+    '''
+    start = perf_counter()
+    for _ in range(rounds):
+        func()
+    return (perf_counter() - start) / rounds
+
+
+def bench_key_setup(key: bytes = None, password: bytes = b'bench',
+                    rounds: int = 200) -> dict:
+    '''
+    Per-call DOPE setup cost on the SecFS data path
+    Args:
+        key: bytes - Serialized DOPE Key, fresh key if None
+        password: bytes - Key Password
+        rounds: int - Calls per measurement
+
+    Returns:
+        dict - Seconds per call for marshall+fixate and KeyContext
+    '''
+    if key is None:
+        key = DOPE2(password, 8219, 32, 'GCM', b'',
+                    block_size=512).serialize()
+
+    def marshall():
+        dopex = DOPE2.marshall(key, password)
+        dopex.fixate()
+
+    keyring = KeyContext(key, password)
+
+    def pooled():
+        with keyring.codec():
+            pass
+
+    return {
+        'marshall': timed(marshall, rounds),
+        'keyring': timed(pooled, rounds)
+    }
+
+
+def bench_dope_seek(blocks: int = 1024, checkpoint: int = 16,
+                    rounds: int = 20) -> dict:
+    '''
+    Cost of decoding the last block of a DOPE object
+    Args:
+        blocks: int - Packets in the encoded object
+        checkpoint: int - Checkpoint interval to compare against
+        rounds: int - Calls per measurement
+
+    Returns:
+        dict - Seconds per tail decode with and without checkpoints
+    '''
+    result = {}
+    for interval in (0, checkpoint):
+        dopex = DOPE2(b'bench', 8219, 32, 'GCM', b'', block_size=512,
+                      checkpoint=interval)
+        data = dopex.encode(urandom((dopex.block_size - 4) * blocks))
+        result[f'checkpoint_{interval}'] = timed(
+            lambda: dopex.decode(data, blocks - 1, blocks), rounds)
+    return result
+
+
+def bench_dope_parallel(size: int = 1 << 22, workers: list = None,
+                        executor: str = 'process') -> dict:
+    '''
+    Throughput of chained DOPE2 against index keyed pools
+    Args:
+        size: int - Bytes encoded per measurement
+        workers: list - Worker counts, powers of two up to cpu_count if None
+        executor: str - 'process' or 'thread' pool
+
+    Returns:
+        dict - Encode and Decode MB/s per configuration
+    '''
+    if workers is None:
+        workers = [1]
+        while workers[-1] * 2 <= (cpu_count() or 1):
+            workers.append(workers[-1] * 2)
+    data = urandom(size)
+    configs = [('BLAKE0x0', 1)] + [('BLAKEIDX', x) for x in workers]
+    result = {}
+    for ratchet_mode, count in configs:
+        dopex = DOPE2(b'bench', 8219, 32, 'GCM', b'', block_size=512,
+                      ratchet_mode=ratchet_mode, workers=count,
+                      executor=executor)
+        dopex.decode(dopex.encode(data[:4096]))  # Warm the pool
+        start = perf_counter()
+        code = dopex.encode(data)
+        encode = perf_counter() - start
+        start = perf_counter()
+        dopex.decode(code)
+        decode = perf_counter() - start
+        result[f'{ratchet_mode}_{count}'] = {
+            'encode_mbps': size / encode / 1E6,
+            'decode_mbps': size / decode / 1E6
+        }
+    return result
+
+
+def to_legacy(dopex: DOPE2, code: bytes) -> bytes:
+    '''
+    Repackage a chained Binary Container as a DOPE 2.0 dill Container
+    '''
+    count = CONTAINER.unpack_from(code)[4]
+    size = dopex.packet_size
+    view = memoryview(code)[CONTAINER.size:]
+    code_string = []
+    for x in range(count):
+        _, nonce, pad, data, tag, ecc = unpack_packet(
+            view[x * size:(x + 1) * size], dopex.aes_mode, dopex.ecc_bytes)
+        packet = {
+            'block': x,
+            'header': b'DOPE' + bytes(nonce),
+            'pad_len': pad.to_bytes(4, 'big'),
+            'data': bytes(data),
+            'ecc': bytes(ecc)
+        }
+        if len(tag):
+            packet['tag'] = bytes(tag)
+        code_string.append(dumps(packet))
+    return dumps(code_string)
+
+
+def bench_packet_format(size: int = 1 << 20) -> dict:
+    '''
+    Binary Container against DOPE 2.0 dill Container
+    Args:
+        size: int - Bytes encoded per measurement
+
+    Returns:
+        dict - Container bytes, expansion and MB/s per format
+    '''
+    data = urandom(size)
+    dopex = DOPE2(b'bench', 8219, 32, 'GCM', b'', block_size=512)
+    start = perf_counter()
+    binary = dopex.encode(data)
+    encode = perf_counter() - start
+    start = perf_counter()
+    legacy = to_legacy(dopex, binary)
+    framing = perf_counter() - start
+    result = {}
+    for name, code, seconds in (('binary', binary, encode),
+                                ('dill', legacy, encode + framing)):
+        start = perf_counter()
+        dopex.decode(code)
+        decode = perf_counter() - start
+        result[name] = {
+            'bytes': len(code),
+            'expansion': len(code) / size,
+            'encode_mbps': size / seconds / 1E6,
+            'decode_mbps': size / decode / 1E6
+        }
+    return result
+
+
+def bench_byte_ops(sizes: tuple = (32, 64, 508, 4096, 65536),
+                   rounds: int = 2000) -> dict:
+    '''
+    byte_xor and byte_and against the per byte comprehension
+    Args:
+        sizes: tuple - Buffer sizes, DOPE mixes 32 and 64 byte keys
+        rounds: int - Calls per measurement
+
+    Returns:
+        dict - Seconds per call per operation and size
+    '''
+    result = {}
+    for size in sizes:
+        left, right = urandom(size), urandom(size)
+        result[size] = {
+            'xor_bytewise': timed(lambda: bytes(
+                [a ^ b for a, b in zip(left, right)]), rounds),
+            'xor': timed(lambda: byte_xor(left, right), rounds),
+            'and_bytewise': timed(lambda: bytes(
+                [a & b for a, b in zip(left, right)]), rounds),
+            'and': timed(lambda: byte_and(left, right), rounds)
+        }
+    dopex = DOPE2(b'bench', 8219, 32, 'GCM', b'', block_size=512)
+    result['fixate'] = timed(dopex.fixate, rounds)
+    return result
+
+
+def bench_sequential_read(size: int = 1 << 24, chunk: int = 1 << 17,
+                          windows: tuple = (0, 4)) -> dict:
+    '''
+    Sequential SecFS read throughput with and without read-ahead
+    Args:
+        size: int - File size in bytes
+        chunk: int - Bytes per read call, FUSE sends 128 KiB
+        windows: tuple - Read-ahead worker counts, 0 disables it
+
+    Returns:
+        dict - MB/s per worker count on a cold cache
+    '''
+    from .litefs import REGF
+    result = {}
+    with scratch():
+        fs = mount()
+        fh = fs.create('/seq', REGF | 0o644)
+        data = urandom(size)
+        for x in range(0, size, chunk):
+            fs.write('/seq', data[x:x + chunk], x, fh)
+        fs.flush('/seq', fh)
+        fs.destroy()
+        for workers in windows:
+            fs = mount(readahead=workers)
+            fh = fs.open('/seq', os.O_RDONLY)
+            start = perf_counter()
+            for x in range(0, size, chunk):
+                fs.read('/seq', chunk, x, fh)
+            result[f'readahead_{workers}'] = size / (
+                perf_counter() - start) / 1E6
+            fs.release('/seq', fh)
+            fs.destroy()
+    return result
+
+
+HIGHER_BETTER = ('_mbps', '_ops')
+LOWER_BETTER = ('_s', '_us')
+
+
+@contextmanager
+def scratch():
+    '''
+    Run the block inside a throwaway working directory
+    '''
+    cwd = os.getcwd()
+    with TemporaryDirectory() as work:
+        os.chdir(work)
+        try:
+            yield work
+        finally:
+            os.chdir(cwd)
+
+
+def mount(**kwargs):
+    '''
+    SecFS on the bench volume of the working directory, no kernel mount
+    '''
+    from .litefs import SecFS
+    return SecFS('bench', b'bench', 'bench', **kwargs)
+
+
+def bench_dope_codec(sizes: tuple = (4096, 1 << 16, 1 << 20)) -> dict:
+    '''
+    DOPE2.encode and DOPE2.decode throughput
+    Args:
+        sizes: tuple - Plaintext sizes in bytes
+
+    Returns:
+        dict - Encode and Decode MB/s per size
+    '''
+    result = {}
+    dopex = DOPE2(b'bench', 8219, 32, 'GCM', b'', block_size=512)
+    for size in sizes:
+        data = urandom(size)
+        rounds = max(1, (1 << 20) // size)
+        code = dopex.encode(data)
+        result[str(size)] = {
+            'encode_mbps': size / timed(lambda: dopex.encode(data),
+                                        rounds) / 1E6,
+            'decode_mbps': size / timed(lambda: dopex.decode(code),
+                                        rounds) / 1E6
+        }
+    return result
+
+
+def bench_io(total: int = 1 << 22,
+             sizes: tuple = (4096, 1 << 16, 1 << 20)) -> dict:
+    '''
+    Sequential and random SecFS read/write at several I/O sizes
+    Reads run on a freshly mounted volume so the block cache is cold
+    Args:
+        total: int - Bytes moved per measurement
+        sizes: tuple - I/O sizes in bytes
+
+    Returns:
+        dict - MB/s per I/O size and pattern
+    '''
+    from .litefs import REGF
+    result = {}
+    for size in sizes:
+        count = max(1, total // size)
+        data = urandom(size)
+        order = random.Random(size).sample(range(count), count)
+        rates = {}
+        with scratch():
+            fs = mount()
+            fh = fs.create('/io', REGF | 0o644)
+            start = perf_counter()
+            for x in range(count):
+                fs.write('/io', data, x * size, fh)
+            fs.flush('/io', fh)
+            rates['seq_write_mbps'] = count * size / (
+                perf_counter() - start) / 1E6
+            start = perf_counter()
+            for x in order:
+                fs.write('/io', data, x * size, fh)
+            fs.flush('/io', fh)
+            rates['rand_write_mbps'] = count * size / (
+                perf_counter() - start) / 1E6
+            fs.destroy()
+            for name, blocks in (('seq_read_mbps', range(count)),
+                                 ('rand_read_mbps', order)):
+                fs = mount()
+                fh = fs.open('/io', os.O_RDONLY)
+                start = perf_counter()
+                for x in blocks:
+                    fs.read('/io', size, x * size, fh)
+                rates[name] = count * size / (perf_counter() - start) / 1E6
+                fs.release('/io', fh)
+                fs.destroy()
+        result[str(size)] = rates
+    return result
+
+
+def bench_metadata(count: int = 1000) -> dict:
+    '''
+    create, stat and unlink storms in one directory
+    Args:
+        count: int - Files per storm
+
+    Returns:
+        dict - Operations per second per phase
+    '''
+    from .litefs import REGF
+    result = {}
+    with scratch():
+        fs = mount()
+        fs.mkdir('/storm', 0o755)
+        names = [f'/storm/f{x}' for x in range(count)]
+        for phase, call in (('create_ops', lambda x: fs.create(
+                                x, REGF | 0o644)),
+                            ('stat_ops', fs.getattr),
+                            ('unlink_ops', fs.unlink)):
+            start = perf_counter()
+            for name in names:
+                call(name)
+            result[phase] = count / (perf_counter() - start)
+        fs.destroy()
+    return result
+
+
+def bench_readdir(entries: tuple = (100, 1000, 10000),
+                  rounds: int = 20) -> dict:
+    '''
+    readdir latency on large directories
+    Args:
+        entries: tuple - Directory sizes
+        rounds: int - Calls per measurement
+
+    Returns:
+        dict - Seconds per readdir per directory size
+    '''
+    from .litefs import REGF
+    result = {}
+    with scratch():
+        fs = mount()
+        for count in entries:
+            path = f'/d{count}'
+            fs.mkdir(path, 0o755)
+            for x in range(count):
+                fs.create(f'{path}/f{x}', REGF | 0o644)
+            result[str(count)] = {
+                'readdir_s': timed(lambda: fs.readdir(path, 0), rounds)
+            }
+        fs.destroy()
+    return result
+
+
+def bench_mount(files: tuple = (100, 1000, 10000)) -> dict:
+    '''
+    Mount time against the number of Inodes in the tree
+    Args:
+        files: tuple - Files in the volume
+
+    Returns:
+        dict - Seconds to construct SecFS per tree size
+    '''
+    from .litefs import REGF
+    result = {}
+    for count in files:
+        with scratch():
+            fs = mount()
+            for x in range(count):
+                if not x % 100:
+                    fs.mkdir(f'/d{x // 100}', 0o755)
+                fs.create(f'/d{x // 100}/f{x}', REGF | 0o644)
+            fs.destroy()
+            start = perf_counter()
+            fs = mount()
+            result[str(count)] = {'mount_s': perf_counter() - start}
+            fs.destroy()
+    return result
+
+
+def suffixed(result: dict, suffix: str) -> dict:
+    '''
+    Results with a unit suffix on every metric name
+    '''
+    named = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            named[str(key)] = suffixed(value, suffix)
+        else:
+            named[f'{key}{suffix}'] = value
+    return named
+
+
+def run_suite(quick: bool = False) -> dict:
+    '''
+    Every mount-free benchmark, metric names carry the unit suffix
+    compare reads
+    Args:
+        quick: bool - Smaller workloads for a fast signal
+
+    Returns:
+        dict - Results keyed by benchmark
+    '''
+    scale = 16 if quick else 1
+    return {
+        'dope_codec': bench_dope_codec(
+            (4096, 1 << 16) if quick else (4096, 1 << 16, 1 << 20)),
+        'key_setup': suffixed(bench_key_setup(rounds=200 // scale), '_s'),
+        'dope_seek': suffixed(bench_dope_seek(
+            rounds=max(1, 20 // scale)), '_s'),
+        'dope_parallel': bench_dope_parallel(size=(1 << 22) // scale),
+        'packet_format': bench_packet_format(size=(1 << 20) // scale),
+        'byte_ops': suffixed(bench_byte_ops(rounds=2000 // scale), '_s'),
+        'sequential_read': suffixed(bench_sequential_read(
+            size=(1 << 24) // scale), '_mbps'),
+        'io': bench_io(total=(1 << 22) // scale),
+        'metadata': bench_metadata(count=1000 // scale * 2),
+        'readdir': bench_readdir(
+            (100, 1000) if quick else (100, 1000, 10000)),
+        'mount': bench_mount((100, 1000) if quick else (100, 1000, 10000))
+    }
+
+
+def flatten(result: dict, prefix: str = '') -> dict:
+    '''
+    Nested results as {'a.b.metric': value}
+    '''
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(result: dict, baseline: dict, threshold: float = 0.1) -> list:
+    '''
+    Metrics that got worse than the baseline by more than threshold
+    Metric names ending in _mbps or _ops are rates, _s or _us are times
+    Args:
+        result: dict - Current results
+        baseline: dict - Saved results
+        threshold: float - Relative change tolerated
+
+    Returns:
+        list - Regressions as dicts of metric, baseline, current, change
+    '''
+    current, saved = flatten(result), flatten(baseline)
+    regressions = []
+    for metric, value in current.items():
+        old = saved.get(metric)
+        if not old:
+            continue
+        if metric.endswith(HIGHER_BETTER):
+            worse = value < old * (1 - threshold)
+        elif metric.endswith(LOWER_BETTER):
+            worse = value > old * (1 + threshold)
+        else:
+            continue
+        if worse:
+            regressions.append({
+                'metric': metric,
+                'baseline': old,
+                'current': value,
+                'change': value / old - 1
+            })
+    return regressions
+
+
+if __name__ == '__main__':
+    for name, cost in {**bench_key_setup(), **bench_dope_seek()}.items():
+        print(f'{name:>14} : {cost * 1E6:10.2f} us/call')
+    for size, cost in bench_byte_ops().items():
+        if size == 'fixate':
+            print(f'{size:>14} : {cost * 1E6:10.2f} us/call')
+            continue
+        print(f'{size:>14} : ' + ' '.join(
+            f'{op} {seconds * 1E6:8.2f} us' for op, seconds in cost.items()))
+    for name, rate in bench_packet_format().items():
+        print(f'{name:>14} : {rate["expansion"]:8.4f} x size'
+              + f' {rate["encode_mbps"]:8.2f} MB/s encode'
+              + f' {rate["decode_mbps"]:8.2f} MB/s decode')
+    for name, rate in bench_dope_parallel().items():
+        print(f'{name:>14} : {rate["encode_mbps"]:8.2f} MB/s encode'
+              + f' {rate["decode_mbps"]:8.2f} MB/s decode')
+    for name, rate in bench_sequential_read().items():
+        print(f'{name:>14} : {rate:8.2f} MB/s sequential read')
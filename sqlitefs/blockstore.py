@@ -0,0 +1,404 @@
+'''
+SQLiteFS Block Store
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from hashlib import blake2b
+
+
+BLOCK_SIZE = 4096
+LAYOUT_BLOCKS = 0x01
+
+
+def block_span(offset: int, size: int) -> range:
+    '''
+    Block numbers covered by a byte range
+    Args:
+        offset: int - Start of the range
+        size: int - Length of the range
+
+    Returns:
+        range - Block Numbers
+    '''
+    if size <= 0:
+        return range(0)
+    return range(offset // BLOCK_SIZE, (offset + size - 1) // BLOCK_SIZE + 1)
+
+
+def block_count(size: int) -> int:
+    '''
+    Number of blocks holding a file of given size
+    '''
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+
+
+def is_hole(holes: list, block: int) -> bool:
+    '''
+    Whether a block lies in the sorted (start, end) hole ranges
+    '''
+    if not holes:
+        return False
+    x = bisect_right(holes, (block, float('inf'))) - 1
+    return x >= 0 and holes[x][0] <= block < holes[x][1]
+
+
+def fill(holes: list, start: int, end: int) -> list:
+    '''
+    Hole ranges without blocks [start, end)
+    '''
+    result = []
+    for x, y in holes or []:
+        if y <= start or x >= end:
+            result.append((x, y))
+            continue
+        if x < start:
+            result.append((x, start))
+        if y > end:
+            result.append((end, y))
+    return result
+
+
+def punch(holes: list, start: int, end: int) -> list:
+    '''
+    Hole ranges with blocks [start, end) added
+    '''
+    if start >= end:
+        return list(holes or [])
+    result = []
+    for x, y in sorted(fill(holes, start, end) + [(start, end)]):
+        if result and result[-1][1] == x:
+            result[-1] = (result[-1][0], y)
+        else:
+            result.append((x, y))
+    return result
+
+
+def extents(holes: list, start: int, end: int) -> list:
+    '''
+    Ranges of [start, end) outside the holes
+    '''
+    result = []
+    for x, y in holes or []:
+        if y <= start:
+            continue
+        if x >= end:
+            break
+        if x > start:
+            result.append((start, x))
+        start = max(start, y)
+    if start < end:
+        result.append((start, end))
+    return result
+
+
+def held(holes: list, start: int, end: int) -> int:
+    '''
+    Bytes of the byte range [start, end) outside the holes
+    '''
+    if start >= end:
+        return 0
+    return sum(min(y * BLOCK_SIZE, end) - max(x * BLOCK_SIZE, start)
+               for x, y in extents(holes, start // BLOCK_SIZE,
+                                   block_count(end)))
+
+
+def keyed_fingerprint(key: bytes):
+    '''
+    Keyed BLAKE2b content fingerprint, plaintext hashes
+    never reach the store
+    Args:
+        key: bytes - Volume fingerprint key
+
+    Returns:
+        callable - bytes to hex fingerprint
+    '''
+    def fingerprint(data: bytes) -> str:
+        return blake2b(data, key=key, digest_size=20).hexdigest()
+    return fingerprint
+
+
+class BlockStore(object):
+    """
+    Block Addressable Data Store
+    Every encrypted block is its own row keyed by
+    (file id, block number), file ids are stable Inode IDs
+    so renames never touch this store.
+    With a fingerprint function blocks are deduplicated, a file row
+    then holds the fingerprint of a shared, reference counted block
+    that is encrypted and stored once
+    Parameters:-
+        db: Storage - Volume Store
+        fingerprint: callable - Keyed fingerprint, None disables dedup
+    """
+    STATS = 'dedup:stats'
+
+    def __init__(self, db, fingerprint=None):
+        self.db = db
+        self.fingerprint = fingerprint
+        self.lock = threading.Lock()
+        stats = db.get(self.STATS)
+        self.shared = fingerprint is not None or stats is not None
+        self.logical, self.unique = stats or (0, 0)
+
+    @staticmethod
+    def key(file_id: int, block: int) -> str:
+        return f'{file_id}:{block:016x}'
+
+    @staticmethod
+    def shared_key(fingerprint: str) -> str:
+        return f'dedup:{fingerprint}'
+
+    @staticmethod
+    def refs_key(fingerprint: str) -> str:
+        return f'dedup:{fingerprint}:refs'
+
+    def get(self, file_id: int, block: int) -> bytes:
+        '''
+        Fetch an encrypted block, None if never stored
+        '''
+        data = self.db.get(self.key(file_id, block))
+        if isinstance(data, str):
+            return self.db.get(self.shared_key(data))
+        return data
+
+    def put(self, file_id: int, block: int, data: bytes):
+        '''
+        Store an encrypted block
+        '''
+        self.update(file_id, {block: data})
+
+    def update(self, file_id: int, blocks: dict):
+        '''
+        Store a set of encrypted blocks
+        '''
+        items = {
+            self.key(file_id, block): data for block, data in blocks.items()
+        }
+        if not self.shared:
+            self.db.put_many(items)
+            return
+        with self.lock:
+            self.settle(self.unref(list(items)), items)
+
+    def store(self, file_id: int, blocks: dict, encode) -> int:
+        '''
+        Encrypt and store plaintext blocks, with dedup on only
+        blocks not already in the store are encrypted
+        Args:
+            file_id: int - Stable Inode ID
+            blocks: dict - Block number to plaintext
+            encode: callable - Encrypts one block
+
+        Returns:
+            int - Encrypted bytes written
+        '''
+        if self.fingerprint is None:
+            blocks = {x: encode(bytes(blocks[x])) for x in blocks}
+            self.update(file_id, blocks)
+            return sum(len(x) for x in blocks.values())
+        prints = {x: self.fingerprint(bytes(blocks[x])) for x in blocks}
+        first = {}
+        for block, fingerprint in prints.items():
+            first.setdefault(fingerprint, block)
+        known = self.db.get_many([self.refs_key(x) for x in first])
+        encoded = {
+            x: encode(bytes(blocks[y])) for x, y in first.items()
+            if self.refs_key(x) not in known
+        }
+        written = 0
+        with self.lock:
+            counts = self.unref([self.key(file_id, x) for x in prints])
+            counts.update(self.db.get_many([
+                self.refs_key(x) for x in first
+                if self.refs_key(x) not in counts
+            ]))
+            items = {}
+            for block, fingerprint in prints.items():
+                refs = self.refs_key(fingerprint)
+                if refs not in counts:
+                    if fingerprint not in encoded:
+                        encoded[fingerprint] = encode(
+                            bytes(blocks[first[fingerprint]]))
+                    items[self.shared_key(fingerprint)] = encoded[fingerprint]
+                    written += len(encoded[fingerprint])
+                    counts[refs] = 0
+                    self.unique += 1
+                counts[refs] += 1
+                items[self.key(file_id, block)] = fingerprint
+                self.logical += 1
+            self.settle(counts, items)
+        return written
+
+    def unref(self, keys: list) -> dict:
+        '''
+        Release the shared blocks referenced by file rows,
+        caller holds the lock and settles the counts
+        Returns:
+            dict - Reference counts after release
+        '''
+        fingerprints = [
+            x for x in self.db.get_many(keys).values() if isinstance(x, str)
+        ]
+        counts = self.db.get_many(list({
+            self.refs_key(x) for x in fingerprints
+        }))
+        for fingerprint in fingerprints:
+            counts[self.refs_key(fingerprint)] -= 1
+            self.logical -= 1
+        return counts
+
+    def settle(self, counts: dict, items: dict):
+        '''
+        Write rows and reference counts, drop unreferenced blocks
+        '''
+        dead = []
+        for refs, count in counts.items():
+            if count > 0:
+                items[refs] = count
+            else:
+                dead.extend((refs, refs[:-len(':refs')]))
+                self.unique -= 1
+        items[self.STATS] = (self.logical, self.unique)
+        self.db.put_many(items)
+        self.db.delete_many(dead)
+
+    def drop(self, file_id: int, start: int, end: int):
+        '''
+        Remove blocks in [start, end)
+        '''
+        keys = [self.key(file_id, block) for block in range(start, end)]
+        if self.shared:
+            with self.lock:
+                self.settle(self.unref(keys), {})
+                self.db.delete_many(keys)
+            return
+        self.db.delete_many(keys)
+
+    def stats(self) -> dict:
+        return {
+            'logical_blocks': self.logical,
+            'unique_blocks': self.unique,
+            'dedup_ratio': self.logical / self.unique if self.unique else 1.0,
+            'saved_bytes': (self.logical - self.unique) * BLOCK_SIZE
+        }
+
+
+class BlockCache(object):
+    """
+    Decrypted Block Cache
+    Plaintext blocks keyed by (file id, block number), shared by
+    every handle of a file, bounded in bytes with LRU eviction
+    Parameters:-
+        size: int - Maximum cached bytes
+    """
+    def __init__(self, size: int = 1 << 26):
+        self.size = size
+        self.entries = OrderedDict()
+        self.files = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.resident = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, file_id: int, block: int) -> bytes:
+        '''
+        Cached plaintext, None on a miss
+        '''
+        key = (file_id, block)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        return None
+
+    def generation(self, file_id: int) -> int:
+        '''
+        Invalidation count of a file, taken before a fetch so a block
+        decoded before a write is not cached after it
+        '''
+        return self.generations.get(file_id, 0)
+
+    def put(self, file_id: int, block: int, data: bytes,
+            generation: int = None):
+        if len(data) > self.size:
+            return
+        key = (file_id, block)
+        with self.lock:
+            if generation is not None and\
+                    generation != self.generations.get(file_id, 0):
+                return
+            self.resident += len(data) - len(self.entries.get(key, b''))
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+            self.files.setdefault(file_id, set()).add(block)
+            while self.resident > self.size:
+                (old_id, old_block), old = self.entries.popitem(last=False)
+                self.resident -= len(old)
+                self.files[old_id].discard(old_block)
+                if not self.files[old_id]:
+                    del self.files[old_id]
+                self.evictions += 1
+
+    def invalidate(self, file_id: int, start: int = 0, end: int = None):
+        '''
+        Drop cached blocks in [start, end)
+        '''
+        with self.lock:
+            self.generations[file_id] = self.generations.get(file_id, 0) + 1
+            blocks = self.files.get(file_id, set())
+            for block in [x for x in blocks
+                          if x >= start and (end is None or x < end)]:
+                blocks.discard(block)
+                self.resident -= len(self.entries.pop((file_id, block)))
+            if not blocks:
+                self.files.pop(file_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.files.clear()
+            self.resident = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'resident_bytes': self.resident,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions
+        }
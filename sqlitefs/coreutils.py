@@ -21,9 +21,12 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
+from collections import OrderedDict
 from datetime import datetime
+import threading
 import dill as pickle
 from os import listdir, getgid, getuid
+from .blockstore import LAYOUT_BLOCKS
 
 
 SOCK = 0o0140000
@@ -54,6 +57,9 @@ R_OK = 4
 W_OK = 2
 X_OK = 1
 
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+
 
 def init_fs(volume_name: str, fs_size: int):
     '''
@@ -88,6 +94,10 @@ def init_fs(volume_name: str, fs_size: int):
         },
         0xF7: {
 
+        },
+        0xF6: {
+            'layout': LAYOUT_BLOCKS,
+            'next_ino': 1
         },
         '': {
             0xFF: {
@@ -338,3 +348,113 @@ def lister(path, hash_table):
     '''
     inode = creeper(path, hash_table)
     return [x for x in inode if type(x) == str]
+
+
+def walker(hash_table, path='/'):
+    '''
+    Walks the directory tree
+    CAUTION: THIS FUNCTION IS RECURSIVE
+    Args:
+        hash_table: dict - Hash Table to Walk
+        path: str - Absolute Path of the Hash Table
+
+    Yields:
+        (str, dict) - Path and Inode of every entry
+    '''
+    for name in [x for x in hash_table if type(x) == str]:
+        inode = hash_table[name]
+        inode_path = path + name + '/' if name != '' else path
+        yield inode_path, inode
+        yield from walker(inode, inode_path)
+
+
+class DentryCache(object):
+    """
+    Directory Entry Cache
+    Maps full paths to inodes with negative (ENOENT) entries,
+    bounded with LRU eviction
+    Parameters:-
+        size: int - Maximum cached paths
+    """
+    def __init__(self, size: int = 65536):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(path: str) -> str:
+        return path if path[-1] == '/' else path + '/'
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, path: str, hash_table: dict):
+        '''
+        Cached creeper
+        Args:
+            path: str - Absolute Path String
+            hash_table: dict - Hash Table to Creep
+
+        Returns:
+            * - Path Value
+
+        Raises:
+            KeyError - If path does not exist
+        '''
+        key = self.key(path)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                inode = self.entries[key]
+                if inode is None:
+                    self.negative_hits += 1
+                    raise KeyError(f'Path \'{key}\' does not exist')
+                self.hits += 1
+                return inode
+            self.misses += 1
+        try:
+            inode = creeper(key, hash_table)
+        except KeyError:
+            self.insert(key, None)
+            raise
+        self.insert(key, inode)
+        return inode
+
+    def insert(self, key: str, inode):
+        with self.lock:
+            self.entries[key] = inode
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, path: str, subtree: bool = False):
+        '''
+        Drop a path and its ancestors, and its descendants
+        when a subtree moves or goes away
+        '''
+        key = self.key(path)
+        with self.lock:
+            parts = path_split(key)
+            for x in range(1, len(parts) + 1):
+                self.entries.pop(path_weave(parts[:x]), None)
+            if subtree:
+                for x in [x for x in self.entries if x.startswith(key)]:
+                    del self.entries[x]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
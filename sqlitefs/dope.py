@@ -13,10 +13,27 @@ from Crypto.Random import get_random_bytes
 from Crypto.Signature import pss, pkcs1_15
 import bchlib
 import base64
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Union
 from hashlib import blake2b, blake2s
 from dill import loads, dumps
-from gzip import compress, decompress
+from collections import Counter
+from math import log2
+import zlib
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Lookup Tables
 AES_MODE_LOOKUP = {
@@ -28,6 +45,7 @@ AES_MODE_LOOKUP = {
 RATCHET_MODE_LOOKUP = {
     "BLAKE0x0": 0x0,
     "BLAKEx0x": 0x1,
+    "BLAKEIDX": 0x2,
 }
 HMAC_LOOKUP = {
     "SHA256": SHA256,
@@ -49,59 +67,83 @@ DOPE_HIGHER_LOOKUP = {
     # Higher Byte
     (1024, "GCM", "BLAKE0x0"): b'\x00',
     (1024, "GCM", "BLAKEx0x"): b'\x01',
+    (1024, "GCM", "BLAKEIDX"): b'\x02',
     (1024, "SIV", "BLAKE0x0"): b'\x04',
     (1024, "SIV", "BLAKEx0x"): b'\x05',
+    (1024, "SIV", "BLAKEIDX"): b'\x06',
     (1024, "CBC", "BLAKE0x0"): b'\x08',
     (1024, "CBC", "BLAKEx0x"): b'\x09',
+    (1024, "CBC", "BLAKEIDX"): b'\x0A',
     (1024, "OFB", "BLAKE0x0"): b'\x0C',
     (1024, "OFB", "BLAKEx0x"): b'\x0D',
+    (1024, "OFB", "BLAKEIDX"): b'\x0E',
 
     (2048, "GCM", "BLAKE0x0"): b'\x10',
     (2048, "GCM", "BLAKEx0x"): b'\x11',
+    (2048, "GCM", "BLAKEIDX"): b'\x12',
     (2048, "SIV", "BLAKE0x0"): b'\x14',
     (2048, "SIV", "BLAKEx0x"): b'\x15',
+    (2048, "SIV", "BLAKEIDX"): b'\x16',
     (2048, "CBC", "BLAKE0x0"): b'\x18',
     (2048, "CBC", "BLAKEx0x"): b'\x19',
+    (2048, "CBC", "BLAKEIDX"): b'\x1A',
     (2048, "OFB", "BLAKE0x0"): b'\x1C',
     (2048, "OFB", "BLAKEx0x"): b'\x1D',
+    (2048, "OFB", "BLAKEIDX"): b'\x1E',
 
     (4096, "GCM", "BLAKE0x0"): b'\x20',
     (4096, "GCM", "BLAKEx0x"): b'\x21',
+    (4096, "GCM", "BLAKEIDX"): b'\x22',
     (4096, "SIV", "BLAKE0x0"): b'\x24',
     (4096, "SIV", "BLAKEx0x"): b'\x25',
+    (4096, "SIV", "BLAKEIDX"): b'\x26',
     (4096, "CBC", "BLAKE0x0"): b'\x28',
     (4096, "CBC", "BLAKEx0x"): b'\x29',
+    (4096, "CBC", "BLAKEIDX"): b'\x2A',
     (4096, "OFB", "BLAKE0x0"): b'\x2C',
     (4096, "OFB", "BLAKEx0x"): b'\x2D',
+    (4096, "OFB", "BLAKEIDX"): b'\x2E',
 }
 INV_DOPE_HIGHER_LOOKUP = {
     # Higher Byte
     0x00: (1024, "GCM", "BLAKE0x0"),
     0x01: (1024, "GCM", "BLAKEx0x"),
+    0x02: (1024, "GCM", "BLAKEIDX"),
     0x04: (1024, "SIV", "BLAKE0x0"),
     0x05: (1024, "SIV", "BLAKEx0x"),
+    0x06: (1024, "SIV", "BLAKEIDX"),
     0x08: (1024, "CBC", "BLAKE0x0"),
     0x09: (1024, "CBC", "BLAKEx0x"),
+    0x0A: (1024, "CBC", "BLAKEIDX"),
     0x0C: (1024, "OFB", "BLAKE0x0"),
     0x0D: (1024, "OFB", "BLAKEx0x"),
+    0x0E: (1024, "OFB", "BLAKEIDX"),
 
     0x10: (2048, "GCM", "BLAKE0x0"),
     0x11: (2048, "GCM", "BLAKEx0x"),
+    0x12: (2048, "GCM", "BLAKEIDX"),
     0x14: (2048, "SIV", "BLAKE0x0"),
     0x15: (2048, "SIV", "BLAKEx0x"),
+    0x16: (2048, "SIV", "BLAKEIDX"),
     0x18: (2048, "CBC", "BLAKE0x0"),
     0x19: (2048, "CBC", "BLAKEx0x"),
+    0x1A: (2048, "CBC", "BLAKEIDX"),
     0x1C: (2048, "OFB", "BLAKE0x0"),
     0x1D: (2048, "OFB", "BLAKEx0x"),
+    0x1E: (2048, "OFB", "BLAKEIDX"),
 
     0x20: (4096, "GCM", "BLAKE0x0"),
     0x21: (4096, "GCM", "BLAKEx0x"),
+    0x22: (4096, "GCM", "BLAKEIDX"),
     0x24: (4096, "SIV", "BLAKE0x0"),
     0x25: (4096, "SIV", "BLAKEx0x"),
+    0x26: (4096, "SIV", "BLAKEIDX"),
     0x28: (4096, "CBC", "BLAKE0x0"),
     0x29: (4096, "CBC", "BLAKEx0x"),
+    0x2A: (4096, "CBC", "BLAKEIDX"),
     0x2C: (4096, "OFB", "BLAKE0x0"),
     0x2D: (4096, "OFB", "BLAKEx0x"),
+    0x2E: (4096, "OFB", "BLAKEIDX"),
 }
 DOPE_LOWER_LOOKUP = {
     # Lower Byte
@@ -126,19 +168,252 @@ INV_DOPE_LOWER_LOOKUP = {
     0x21: ("SHA512", "AND-BL"),
 }
 
+# Binary Container
+# magic(4) | DOPE_HIGHER + DOPE_LOWER(2) | version(1) | flags(1)
+# | packet count(4) | checkpoint interval(4)
+# followed by fixed size packets and the sealed checkpoint table
+DOPE_FORMAT_VERSION = 0x01
+FLAG_CHECKPOINTS = 0x01
+CONTAINER = struct.Struct('>4s2sBBII')
+
+# Flag bits 1-2 carry the codec of compressed Containers
+FLAG_CODEC = 0x06
+CODEC_LOOKUP = {
+    "zlib": 0x02,
+    "lz4": 0x04,
+    "zstd": 0x06
+}
+INV_CODEC_LOOKUP = {
+    0x02: "zlib",
+    0x04: "lz4",
+    0x06: "zstd"
+}
+# Data above this many bits of entropy per byte is not compressed
+ENTROPY_LIMIT = 7.5
+
+
+# Buffers from this size on go through NumPy when it is installed
+NUMPY_THRESHOLD = 4096
+
 
 def byte_xor(left: bytes, right: bytes) -> bytes:
     '''
     XOR Byte String, 2 input
+    Truncates to the shorter input
     '''
-    return bytes([a ^ b for a, b in zip(left, right)])
+    size = min(len(left), len(right))
+    if numpy is not None and size >= NUMPY_THRESHOLD:
+        return numpy.bitwise_xor(
+            numpy.frombuffer(left, numpy.uint8, size),
+            numpy.frombuffer(right, numpy.uint8, size)).tobytes()
+    return (int.from_bytes(memoryview(left)[:size], 'big')
+            ^ int.from_bytes(memoryview(right)[:size], 'big'))\
+        .to_bytes(size, 'big')
 
 
 def byte_and(left: bytes, right: bytes) -> bytes:
     '''
     AND Byte String, 2 inputs
+    Truncates to the shorter input
+    '''
+    size = min(len(left), len(right))
+    if numpy is not None and size >= NUMPY_THRESHOLD:
+        return numpy.bitwise_and(
+            numpy.frombuffer(left, numpy.uint8, size),
+            numpy.frombuffer(right, numpy.uint8, size)).tobytes()
+    return (int.from_bytes(memoryview(left)[:size], 'big')
+            & int.from_bytes(memoryview(right)[:size], 'big'))\
+        .to_bytes(size, 'big')
+
+
+def entropy(data: bytes) -> float:
     '''
-    return bytes([a & b for a, b in zip(left, right)])
+    Shannon Entropy in bits per byte
+    '''
+    size = len(data)
+    if not size:
+        return 0.0
+    if numpy is not None and size >= NUMPY_THRESHOLD:
+        counts = numpy.bincount(numpy.frombuffer(data, numpy.uint8))
+        counts = counts[counts > 0] / size
+        return float(-(counts * numpy.log2(counts)).sum())
+    return -sum(x / size * log2(x / size) for x in Counter(data).values())
+
+
+def compression_codec(name: str) -> str:
+    '''
+    Validate a compression codec name
+    Args:
+        name: str - 'zlib', 'lz4', 'zstd', 'auto' for the fastest
+            installed codec, or None / 'none' for no compression
+
+    Returns:
+        str - Codec name or None
+
+    Raises:
+        TypeError - If the codec is unknown or not installed
+    '''
+    if name is None or name == 'none':
+        return None
+    if name == 'auto':
+        return 'zstd' if zstandard is not None else\
+            'lz4' if lz4 is not None else 'zlib'
+    if name not in CODEC_LOOKUP:
+        raise TypeError(f"DOPE does not support {name} compression")
+    if (name == 'lz4' and lz4 is None) or\
+            (name == 'zstd' and zstandard is None):
+        raise TypeError(f"DOPE {name} compression is not installed")
+    return name
+
+
+def compress_data(codec: str, data: bytes) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=1).compress(data)
+    if codec == 'lz4':
+        return lz4.compress(data)
+    return zlib.compress(data, 1)
+
+
+def decompress_data(flags: int, data: bytes) -> bytes:
+    '''
+    Inflate Container Data by the codec in its flags
+    '''
+    codec = INV_CODEC_LOOKUP.get(flags & FLAG_CODEC)
+    if codec is None:
+        return data
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('DOPE Container needs zstd compression')
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'lz4':
+        if lz4 is None:
+            raise ValueError('DOPE Container needs lz4 compression')
+        return lz4.decompress(data)
+    return zlib.decompress(data)
+
+
+BCH_LOCAL = threading.local()
+
+
+def local_bch(bch_poly: int, ecc_size: int):
+    '''
+    Per Thread BCH Codec, bchlib codecs are not shareable
+    '''
+    cache = BCH_LOCAL.__dict__.setdefault('codecs', {})
+    if (bch_poly, ecc_size) not in cache:
+        cache[(bch_poly, ecc_size)] = bchlib.BCH(bch_poly, ecc_size)
+    return cache[(bch_poly, ecc_size)]
+
+
+def packet_size(block_size: int, aes_mode: str, ecc_bytes: int) -> int:
+    '''
+    Size of a Binary Packet
+    flags(1) | nonce(16) | pad_len(4) | data | tag(16, AEAD only) | ecc
+    '''
+    tag_len = 16 if aes_mode in ['SIV', 'GCM'] else 0
+    return 1 + 16 + 4 + block_size - 4 + tag_len + ecc_bytes
+
+
+def unpack_packet(packet: memoryview, aes_mode: str, ecc_bytes: int) -> tuple:
+    '''
+    Split a Binary Packet into its Fields without copying
+    Returns:
+        (int, bytes, int, bytes, bytes, bytes) -
+            flags, nonce, pad_len, data, tag, ecc
+    '''
+    tag_len = 16 if aes_mode in ['SIV', 'GCM'] else 0
+    end = len(packet) - ecc_bytes - tag_len
+    return packet[0], packet[1:17],\
+        int.from_bytes(packet[17:21], 'big'),\
+        packet[21:end], packet[end:end + tag_len], packet[end + tag_len:]
+
+
+def seal_block(bch, aes_mode: str, key: bytes, block: bytes) -> bytes:
+    '''
+    Encrypt and Parity Code a Packed Block into a Binary Packet,
+    the parity covers the ciphertext
+    '''
+    nonce = get_random_bytes(16)
+    if aes_mode in ['SIV', 'GCM']:
+        encoder = AES.new(key, AES_MODE_LOOKUP[aes_mode], nonce=nonce)
+        encoder.update(b'DOPE')
+        data, tag = encoder.encrypt_and_digest(block[4:])
+    else:
+        encoder = AES.new(key, AES_MODE_LOOKUP[aes_mode], iv=nonce)
+        data, tag = encoder.encrypt(block[4:]), b''
+    return b'\x00' + nonce + block[:4] + data + tag + bytes(bch.encode(data))
+
+
+def open_aead(aes_mode: str, key: bytes, nonce: bytes, data: bytes,
+              tag: bytes) -> bytes:
+    '''
+    Decrypt and Verify AEAD Packet Data
+    Raises:
+        ValueError - If the tag does not match
+    '''
+    decoder = AES.new(key, AES_MODE_LOOKUP[aes_mode], nonce=nonce)
+    decoder.update(b'DOPE')
+    return decoder.decrypt_and_verify(data, tag)
+
+
+def open_block(bch, aes_mode: str, key: bytes, packet: memoryview) -> bytes:
+    '''
+    Verify and Decrypt a Binary Packet into its Data
+    AEAD packets are checked by their tag alone, BCH only runs to repair
+    the ciphertext of a packet failing it. Other modes always correct
+    the ciphertext before decrypting.
+    '''
+    _, nonce, pad, data, tag, ecc = unpack_packet(packet, aes_mode,
+                                                  bch.ecc_bytes)
+    if aes_mode in ['SIV', 'GCM']:
+        try:
+            p_data = open_aead(aes_mode, key, nonce, data, tag)
+        except ValueError:
+            flips, data, _ = bch.decode(bytes(data), bytes(ecc))
+            if flips <= 0:
+                raise
+            p_data = open_aead(aes_mode, key, nonce, data, tag)
+    else:
+        _, data, _ = bch.decode(bytes(data), bytes(ecc))
+        decoder = AES.new(key, AES_MODE_LOOKUP[aes_mode], iv=nonce)
+        p_data = decoder.decrypt(bytes(data))
+    return bytes(p_data[:-pad] if pad != 0 else p_data)
+
+
+def open_legacy_block(bch, aes_mode: str, key: bytes, packet: dict) -> bytes:
+    '''
+    Verify and Decrypt a dill Packet from DOPE 2.0 Containers
+    '''
+    header = packet['header']
+    if aes_mode in ['SIV', 'GCM']:
+        decoder = AES.new(key, AES_MODE_LOOKUP[aes_mode], nonce=header[4:])
+        decoder.update(header[:4])
+        p_data = decoder.decrypt_and_verify(packet['data'], packet['tag'])
+    else:
+        decoder = AES.new(key, AES_MODE_LOOKUP[aes_mode], iv=header[4:])
+        p_data = decoder.decrypt(packet['data'])
+        _, p_data, ecc = bch.decode(p_data, packet['ecc'])
+    pad = int.from_bytes(packet['pad_len'], 'big')
+    return bytes(p_data[:-pad] if pad != 0 else p_data)
+
+
+def seal_job(job: tuple) -> bytes:
+    '''
+    Pool Worker for Index Keyed Blocks
+    '''
+    bch_poly, ecc_size, aes_mode, key, block = job
+    return seal_block(local_bch(bch_poly, ecc_size), aes_mode, key, block)
+
+
+def open_job(job: tuple) -> bytes:
+    '''
+    Pool Worker for Index Keyed Packets
+    '''
+    bch_poly, ecc_size, aes_mode, key, packet = job
+    bch = local_bch(bch_poly, ecc_size)
+    if isinstance(packet, dict):
+        return open_legacy_block(bch, aes_mode, key, packet)
+    return open_block(bch, aes_mode, key, memoryview(packet))
 
 
 class DOPE2(object):
@@ -150,15 +425,25 @@ class DOPE2(object):
         bch_poly: int
         ecc_size: int
         aes_mode: str
-        ratchet_mode: str
+        ratchet_mode: str - BLAKE0x0 chained or BLAKEIDX index keyed
+        checkpoint: int - Blocks between ratchet checkpoints, 0 for none
+        workers: int - Pool size for index keyed blocks
+        executor: str - 'process' or 'thread' pool
+        profile: str - Tuner profile name kept in the serialized key
+        compression: str - Codec for compressible data, see
+            compression_codec, recorded in the Container flags
     """
     def __init__(self, key: bytes, bch_poly: int,
                  ecc_size: int, aes_mode: str,
-                 nonce: bytes, block_size: int = 512):
+                 nonce: bytes, block_size: int = 512,
+                 checkpoint: int = 0, ratchet_mode: str = "BLAKE0x0",
+                 workers: int = 1, executor: str = 'process',
+                 profile: str = None, compression: str = None):
         self.__key = key
         self.__bch = bchlib.BCH(bch_poly, ecc_size)
         self.__bch_poly = bch_poly
-        self.___fixture = False
+        self.__fixture = False
+        self.__seed = None
         if len(nonce) == 0:
             self.__nonce = get_random_bytes(32)
         elif len(nonce) < 32:
@@ -183,17 +468,86 @@ class DOPE2(object):
                 self.__aes_size = 256
         else:
             raise TypeError(f"DOPE does not support {aes_mode} mode")
+        if checkpoint >= 0:
+            self.checkpoint = checkpoint
+        else:
+            raise TypeError(
+                f"DOPE does not support checkpoint interval {checkpoint}")
+        if ratchet_mode in ["BLAKE0x0", "BLAKEIDX"]:
+            self.ratchet_mode = ratchet_mode
+        else:
+            raise TypeError(f"DOPE does not support {ratchet_mode} ratchet")
+        if executor not in ['process', 'thread']:
+            raise TypeError(f"DOPE does not support {executor} executor")
+        self.workers = max(1, workers)
+        self.executor = executor
+        if profile is not None and len(profile.encode('utf8')) > 16:
+            raise TypeError(f"DOPE profile name {profile} is too long")
+        self.profile = profile
+        self.compression = compression_codec(compression)
+        self.__pool = None
+
+    def __del__(self):
+        if getattr(self, '_DOPE2__pool', None) is not None:
+            self.__pool.shutdown(wait=False)
 
     def __str__(self):
         DOPE = f'DOPE2_'
         BCH = f'BCH_{self.__bch.t}_{self.__bch.ecc_bytes}_'
         AES = f'AES_{self.__aes_size}_{self.__aes_mode}_'
         BLK = f'BLK_{self.block_size}'
+        if self.ratchet_mode == "BLAKEIDX":
+            BLK += f'_IDX_{self.workers}'
         return DOPE + BCH + AES + BLK
 
     def __repr__(self):
         return self.__str__()
 
+    def clone(self):
+        '''
+        Clone the Codec Parameters into a fresh DOPE2
+        without marshalling the serialized key again
+        '''
+        return self.__class__(self.__key, self.__bch_poly, self.__bch.t,
+                              self.__aes_mode, self.__nonce, self.block_size,
+                              self.checkpoint, self.ratchet_mode,
+                              self.workers, self.executor, self.profile,
+                              self.compression)
+
+    @property
+    def header(self) -> bytes:
+        '''
+        DOPE Container Header, DOPE2 keys sit in the 1024 row
+        '''
+        return DOPE_HIGHER_LOOKUP[(1024, self.__aes_mode, self.ratchet_mode)]\
+            + DOPE_LOWER_LOOKUP[("SHA256", "XOR-BL")]
+
+    @property
+    def packet_size(self) -> int:
+        '''
+        Size of a Binary Packet for this Codec
+        '''
+        return packet_size(self.block_size, self.__aes_mode,
+                           self.__bch.ecc_bytes)
+
+    def pool(self):
+        '''
+        Worker Pool for Index Keyed Blocks, started on first use
+        '''
+        if self.__pool is None:
+            if self.executor == 'process':
+                self.__pool = ProcessPoolExecutor(self.workers)
+            else:
+                self.__pool = ThreadPoolExecutor(self.workers)
+        return self.__pool
+
+    def block_key(self, counter: int) -> bytes:
+        '''
+        Index Keyed Block Key from the Home Key
+        '''
+        return blake2b(counter.to_bytes(16, 'big'), key=self.__home,
+                       digest_size=len(self.__home)).digest()
+
     def serialize(self):
         khac = blake2b(self.__key, digest_size=32).digest()
         nhac = blake2b(self.__nonce, digest_size=32).digest()
@@ -202,6 +556,10 @@ class DOPE2(object):
             + self.__bch_poly.to_bytes(16, 'big')\
             + self.__bch.t.to_bytes(16, 'big')\
             + self.__nonce
+        if self.ratchet_mode != "BLAKE0x0" or self.profile:
+            data += self.header.ljust(16, b'\x00')
+        if self.profile:
+            data += self.profile.encode('utf8').ljust(16, b'\x00')
         if self.__aes_mode in ['SIV', 'GCM']:
             nonce = get_random_bytes(16)
             encoder = AES.new(khac, AES_MODE_LOOKUP[self.__aes_mode],
@@ -240,31 +598,51 @@ class DOPE2(object):
             int.from_bytes(data[:16], 'big'),\
             int.from_bytes(data[16:32], 'big'),\
             int.from_bytes(data[32:48], 'big'),\
-            data[48:]
+            data[48:80]
+        ratchet_mode, profile = "BLAKE0x0", None
+        if len(data) > 80:
+            ratchet_mode = INV_DOPE_HIGHER_LOOKUP[data[80]][2]
+        if len(data) > 96:
+            profile = data[96:112].rstrip(b'\x00').decode('utf8')
         nhac = blake2b(nonce, digest_size=32).digest()
         vkac = blake2b(khac + nhac).digest()
         if vkac != kvac:
             raise ValueError('Key Verification Error')
-        return cls(password, bch_poly, ecc_size, aes_mode, nonce, block_size)
+        return cls(password, bch_poly, ecc_size, aes_mode, nonce, block_size,
+                   ratchet_mode=ratchet_mode, profile=profile)
 
     def fixate(self):
         '''
         Fixate at a key and Start Ratchets
         '''
         # Key = BLAKE(BLAKE(Weak Home) XOR BLAKE(Strong Home))
+        # Key and Nonce never change, the seed is derived once
+        # and every later fixation is a copy of its state
         self.__fixture = True
-        hash_pass = blake2b(self.__key).digest()
-        hash_nonce = blake2b(self.__nonce).digest()
-        if self.__aes_mode == "SIV":
-            self.__hkdf = blake2b(byte_xor(hash_pass, hash_nonce))
-        else:
-            self.__hkdf = blake2b(byte_xor(hash_pass, hash_nonce),
-                                  digest_size=32)
+        if self.__seed is None:
+            hash_pass = blake2b(self.__key).digest()
+            hash_nonce = blake2b(self.__nonce).digest()
+            if self.__aes_mode == "SIV":
+                self.__seed = blake2b(byte_xor(hash_pass, hash_nonce))
+            else:
+                self.__seed = blake2b(byte_xor(hash_pass, hash_nonce),
+                                      digest_size=32)
+            self.__home = self.__seed.digest()
+        self.__hkdf = self.__seed.copy()
+        self.__ratchet_count = 0
 
     @property
     def nonce(self):
         return self.__nonce
 
+    @property
+    def aes_mode(self):
+        return self.__aes_mode
+
+    @property
+    def ecc_bytes(self):
+        return self.__bch.ecc_bytes
+
     def ratchet(self, ecc: Union[bytes, bytearray]):
         '''
         Ratchet to Next Key
@@ -275,6 +653,43 @@ class DOPE2(object):
         key = self.__hkdf.digest()
         self.__hkdf.update(key + bytes(ecc))
 
+    def rebase(self, seed: bytes):
+        '''
+        Restart the Ratchet from a Checkpoint Seed
+        '''
+        self.__hkdf = blake2b(seed, digest_size=len(self.__home))
+
+    def seal_checkpoint(self, seed: bytes) -> bytes:
+        '''
+        Encrypt a Checkpoint Seed under the Home Key
+        nonce(16) | seed | tag(16)
+        '''
+        nonce = get_random_bytes(16)
+        encoder = AES.new(blake2b(self.__home, digest_size=32,
+                                  person=b'DOPE-CHECKPOINT').digest(),
+                          AES.MODE_GCM, nonce=nonce)
+        encoder.update(b'DOPE')
+        data, tag = encoder.encrypt_and_digest(seed)
+        return nonce + data + tag
+
+    def open_checkpoint(self, sealed: bytes) -> bytes:
+        '''
+        Decrypt a Checkpoint Seed under the Home Key
+        '''
+        nonce, data, tag = sealed[:16], sealed[16:-16], sealed[-16:]
+        decoder = AES.new(blake2b(self.__home, digest_size=32,
+                                  person=b'DOPE-CHECKPOINT').digest(),
+                          AES.MODE_GCM, nonce=nonce)
+        decoder.update(b'DOPE')
+        return decoder.decrypt_and_verify(data, tag)
+
+    def fingerprint_key(self) -> bytes:
+        '''
+        Content Fingerprint Key from the Home Key
+        '''
+        return blake2b(self.__home, digest_size=32,
+                       person=b'DOPE-FINGERPRINT').digest()
+
     def key(self) -> bytes:
         '''
         Ratchet to Next Home Key
@@ -299,6 +714,21 @@ class DOPE2(object):
             data_block.append(pad_len + data_x)
         return data_block
 
+    def compress(self, data: bytes) -> tuple:
+        '''
+        Compress Data when it saves at least one packet,
+        high entropy data is left as it is
+        Returns:
+            (bytes, int) - Data and its codec flag
+        '''
+        if self.compression is None or entropy(data) > ENTROPY_LIMIT:
+            return data, 0x00
+        packed = compress_data(self.compression, data)
+        payload = self.block_size - 4
+        if -(-len(packed) // payload) >= -(-len(data) // payload):
+            return data, 0x00
+        return packed, CODEC_LOOKUP[self.compression]
+
     def encode(self, data: bytes) -> bytes:
         '''
         Encode Data in DOPE Data format
@@ -306,84 +736,175 @@ class DOPE2(object):
         '''
         if not self.__fixture:
             self.fixate()
+        data, codec = self.compress(data)
         data_block = self.pack_data(data)
+        if self.ratchet_mode == "BLAKEIDX":
+            return self.encode_indexed(data_block, codec)
         code_string = []
+        checkpoints = []
+        ecc_bytes = self.__bch.ecc_bytes
         counter = -1
         for x in data_block:  # x: Data Batch
             counter += 1
-            key = self.key()
-            ecc = self.__bch.encode(x[4:])
-            if self.__aes_mode in ['SIV', 'GCM']:
-                nonce = get_random_bytes(16)
-                encoder = AES.new(key, AES_MODE_LOOKUP[self.__aes_mode],
-                                  nonce=nonce)
-                encoder.update(b'DOPE')
-                header = b'DOPE' + nonce
-                data, tag = encoder.encrypt_and_digest(x[4:])
-                packet = {
-                    'block': counter,
-                    'header': header,
-                    'pad_len': x[:4],
-                    'data': data,
-                    'tag': tag,
-                    'ecc': bytes(self.__bch.encode(data))
-                }
-                code_string.append(dumps(packet))
-            else:
-                encoder = AES.new(key, AES_MODE_LOOKUP[self.__aes_mode])
-                header = b'DOPE' + encoder.iv
-                data = encoder.encrypt(x[4:])
-                packet = {
-                    'block': counter,
-                    'header': header,
-                    'pad_len': x[:4],
-                    'data': data,
-                    'ecc': bytes(self.__bch.encode(data))
-                }
-                code_string.append(dumps(packet))
-            self.ratchet(packet['ecc'])
-        packets = dumps(code_string)
+            if self.checkpoint and counter and\
+                    counter % self.checkpoint == 0:
+                seed = self.key()
+                checkpoints.append(self.seal_checkpoint(seed))
+                self.rebase(seed)
+            packet = seal_block(self.__bch, self.__aes_mode, self.key(), x)
+            code_string.append(packet)
+            self.ratchet(packet[-ecc_bytes:])
         self.__fixture = False
-        return packets
+        return CONTAINER.pack(b'DOPE', self.header, DOPE_FORMAT_VERSION,
+                              (FLAG_CHECKPOINTS if checkpoints else 0x00)
+                              | codec, len(code_string), self.checkpoint)\
+            + b''.join(code_string) + b''.join(checkpoints)
 
     def decode(self, data: bytes, start: int = 0, end: int = 0) -> bytes:
         '''
         Decode Data in DOPE Data format
-        by marshalling the byte string
+        by slicing the binary container
         '''
         if not hasattr(self, '__fixture'):
             self.fixate()
+        if data[:4] != b'DOPE' or data[6] == 0x80:
+            return self.decode_legacy(data, start, end)
+        _, header, version, flags, count, interval =\
+            CONTAINER.unpack_from(data)
+        if version != DOPE_FORMAT_VERSION:
+            raise ValueError(f'DOPE does not support format {version}')
+        if end < start:
+            raise ValueError('Inavlid Parameters for \'end\'')
+        if flags & FLAG_CODEC and (start or end):
+            raise ValueError('Compressed DOPE Containers decode whole')
+        if end == start == 0:
+            end = count
+        size = self.packet_size
+        if end > count or len(data) < CONTAINER.size + count * size:
+            raise ValueError('Truncated DOPE Container')
+        view = memoryview(data)[CONTAINER.size:]
+        packets = [view[x * size:(x + 1) * size] for x in range(count)]
+        if INV_DOPE_HIGHER_LOOKUP[header[0]][2] == "BLAKEIDX":
+            return decompress_data(flags,
+                                   self.decode_indexed(packets, start, end))
+        if not flags & FLAG_CHECKPOINTS:
+            interval = 0
+        table = view[count * size:]
+        seal_size = 32 + len(self.__home)
+        ecc_bytes = self.__bch.ecc_bytes
+        data = []
+        x = 0
+        if interval and start >= interval:
+            x = start - start % interval
+            k = x // interval - 1
+            self.rebase(self.open_checkpoint(
+                table[k * seal_size:(k + 1) * seal_size]))
+        based = x
+        while x < start:
+            if interval and x % interval == 0 and x != based:
+                self.rebase(self.key())
+            self.ratchet(packets[x][-ecc_bytes:])
+            x += 1
+        for x in range(start, end):
+            if interval and x % interval == 0 and x != based:
+                self.rebase(self.key())
+            data.append(open_block(self.__bch, self.__aes_mode, self.key(),
+                                   packets[x]))
+            self.ratchet(packets[x][-ecc_bytes:])
+        self.__fixture = False
+        return decompress_data(flags, b''.join(data))
+
+    def decode_legacy(self, data: bytes, start: int = 0,
+                      end: int = 0) -> bytes:
+        '''
+        Decode dill pickled DOPE 2.0 Containers
+        '''
+        if data[:4] == b'DOPE':
+            return self.decode_indexed(
+                [loads(x) for x in loads(data[6:])], start, end)
         code_string = loads(data)
+        interval, checkpoints = 0, {}
+        if isinstance(code_string, dict):
+            interval = code_string['interval']
+            checkpoints = code_string['checkpoints']
+            code_string = code_string['packets']
         data = b''
         if end < start:
             raise ValueError('Inavlid Parameters for \'end\'')
         if end == start == 0:
             end = len(code_string)
         x = 0
+        if interval and start >= interval:
+            x = start - start % interval
+            self.rebase(self.open_checkpoint(b''.join(checkpoints[x])))
+        based = x
         while x < start:
+            if interval and x % interval == 0 and x != based:
+                self.rebase(self.key())
             packet = loads(code_string[x])
             self.ratchet(packet['ecc'])
             x += 1
         for x in range(start, end):
-            key = self.key()
+            if interval and x % interval == 0 and x != based:
+                self.rebase(self.key())
             packet = loads(code_string[x])
-            if self.__aes_mode in ['SIV', 'GCM']:
-                header = packet['header']
-                decoder = AES.new(key, AES_MODE_LOOKUP[self.__aes_mode],
-                                  nonce=header[4:])
-                decoder.update(header[:4])
-                p_data = decoder.decrypt_and_verify(packet['data'],
-                                                    packet['tag'])
-                _, p_data, ecc = self.__bch.decode(p_data, packet['ecc'])
-                pad = int.from_bytes(packet['pad_len'], 'big')
-                data += p_data[:-pad] if pad != 0 else p_data
-            else:
-                decoder = AES.new(key, AES_MODE_LOOKUP[self.__aes_mode],
-                                  iv=header[4:])
-                p_data = decoder.decrypt(packet['data'])
-                _, p_data, ecc = self.__bch.decode(p_data, packet['ecc'])
-                pad = int.from_bytes(packet['pad_len'], 'big')
-                data += p_data[:-pad] if pad != 0 else p_data
+            data += open_legacy_block(self.__bch, self.__aes_mode,
+                                      self.key(), packet)
             self.ratchet(packet['ecc'])
         self.__fixture = False
         return data
+
+    def convert(self, data: bytes) -> bytes:
+        '''
+        Re-encode a dill pickled DOPE 2.0 Container
+        in the Binary Container format
+        '''
+        if data[:4] == b'DOPE' and data[6] != 0x80:
+            return data
+        data = self.decode(data)
+        self.fixate()
+        return self.encode(data)
+
+    def encode_indexed(self, data_block: list, codec: int = 0x00) -> bytes:
+        '''
+        Encode Packed Blocks with Index Keys,
+        every block is independent and sealed on the pool
+        '''
+        jobs = [(self.__bch_poly, self.__bch.t, self.__aes_mode,
+                 self.block_key(counter), x)
+                for counter, x in enumerate(data_block)]
+        if self.workers > 1 and len(jobs) > 1:
+            code_string = list(self.pool().map(
+                seal_job, jobs,
+                chunksize=max(1, len(jobs) // (self.workers * 4))))
+        else:
+            code_string = [seal_job(x) for x in jobs]
+        self.__fixture = False
+        return CONTAINER.pack(b'DOPE', self.header, DOPE_FORMAT_VERSION,
+                              codec, len(code_string), 0)\
+            + b''.join(code_string)
+
+    def decode_indexed(self, packets: list, start: int = 0,
+                       end: int = 0) -> bytes:
+        '''
+        Decode Index Keyed Packets,
+        every packet is independent and opened on the pool
+        '''
+        if end < start:
+            raise ValueError('Inavlid Parameters for \'end\'')
+        if end == start == 0:
+            end = len(packets)
+        pooled = self.workers > 1 and end - start > 1
+        jobs = [(self.__bch_poly, self.__bch.t, self.__aes_mode,
+                 self.block_key(x),
+                 bytes(packets[x]) if pooled and
+                 isinstance(packets[x], memoryview) else packets[x])
+                for x in range(start, end)]
+        if pooled:
+            data = b''.join(self.pool().map(
+                open_job, jobs,
+                chunksize=max(1, len(jobs) // (self.workers * 4))))
+        else:
+            data = b''.join([open_job(x) for x in jobs])
+        self.__fixture = False
+        return data
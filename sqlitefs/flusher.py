@@ -0,0 +1,160 @@
+'''
+SQLiteFS Group Commit Flusher
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import threading
+
+
+class Flusher(object):
+    """
+    Group Commit Flusher
+    Commits run on one background thread every interval or once
+    enough bytes are dirty, sync callers wait for the next commit
+    instead of forcing their own
+    Parameters:-
+        commit: callable - Performs one group commit
+        interval: float - Seconds between commits
+        limit: int - Dirty bytes that trigger an early commit
+    """
+    def __init__(self, commit, interval: float = 1.0, limit: int = 1 << 24):
+        self.commit = commit
+        self.interval = interval
+        self.limit = limit
+        self.pending = 0
+        self.started = 0
+        self.finished = 0
+        self.commits = 0
+        self.wanted = 0
+        self.waiters = 0
+        self.succeeded = 0
+        self.failed = (0, None)
+        self.__cond = threading.Condition()
+        self.__stop = False
+        self.__thread = None
+
+    def dirty(self, size: int = 0):
+        '''
+        Account bytes written since the last commit
+        '''
+        with self.__cond:
+            self.pending += max(size, 1)
+            if self.pending >= self.limit:
+                self.__cond.notify_all()
+
+    def sync(self):
+        '''
+        Block until a commit started after this call has finished
+        '''
+        if self.__thread is None:
+            self.flush()
+            return
+        with self.__cond:
+            target = self.started + 1
+            self.wanted = max(self.wanted, target)
+            self.waiters += 1
+            self.__cond.notify_all()
+            while self.finished < target and self.__thread is not None:
+                self.__cond.wait()
+            self.waiters -= 1
+            finished, succeeded = self.finished, self.succeeded
+            error = self.failed[1]
+        if finished >= target and succeeded < target:
+            raise error
+        if self.finished < target:
+            self.flush()
+
+    def flush(self):
+        '''
+        Run one group commit on the calling thread, a failure is
+        kept for every sync whose generation no later commit covered
+        '''
+        with self.__cond:
+            self.started += 1
+            generation = self.started
+            self.pending = 0
+        try:
+            self.commit()
+        except Exception as e:
+            with self.__cond:
+                self.failed = (generation, e)
+            raise
+        else:
+            with self.__cond:
+                self.succeeded = max(self.succeeded, generation)
+        finally:
+            with self.__cond:
+                self.finished = max(self.finished, generation)
+                self.commits += 1
+                self.__cond.notify_all()
+
+    def start(self):
+        '''
+        Start the background Flusher thread
+        '''
+        if self.__thread is not None:
+            return
+        self.__stop = False
+        self.__thread = threading.Thread(target=self.run, daemon=True,
+                                         name='group-commit')
+        self.__thread.start()
+
+    def stop(self):
+        '''
+        Stop the background Flusher thread after a final commit
+        '''
+        if self.__thread is None:
+            return
+        with self.__cond:
+            self.__stop = True
+            self.__cond.notify_all()
+        self.__thread.join()
+        with self.__cond:
+            self.__thread = None
+            self.__cond.notify_all()
+        self.flush()
+
+    def run(self):
+        while True:
+            with self.__cond:
+                if not (self.__stop or self.wanted > self.finished or
+                        self.pending >= self.limit):
+                    self.__cond.wait(self.interval)
+                if self.__stop:
+                    break
+                if not (self.pending or self.wanted > self.finished):
+                    continue
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            'commits': self.commits,
+            'pending_bytes': self.pending,
+            'waiters': self.waiters
+        }
@@ -0,0 +1,322 @@
+'''
+SQLiteFS Bulk Importer
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import os
+import stat
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+from .keyring import KeyContext
+from .journal import inode_head
+from .coreutils import creeper, seeper, DIRT, WUSR
+from .blockstore import BLOCK_SIZE, punch
+
+
+# Codec of the calling pool worker, set by import_worker
+WORKER = {}
+
+
+def import_worker(key: bytes, password: bytes, compression: str = None):
+    '''
+    Pool Initializer, marshalls the volume key once per worker
+    '''
+    WORKER['keyring'] = KeyContext(key, password, compression=compression)
+
+
+def encode_job(blocks: list) -> list:
+    '''
+    Pool Worker, encrypts plaintext blocks one container each
+    '''
+    with WORKER['keyring'].codec() as dopex:
+        return [dopex.encode(x) for x in blocks]
+
+
+def source_size(source: str) -> int:
+    '''
+    Bytes in the regular files of a host tree
+    '''
+    size = 0
+    for host, _, files in os.walk(source):
+        for name in files:
+            try:
+                info = os.lstat(os.path.join(host, name))
+            except OSError:
+                continue
+            if stat.S_ISREG(info.st_mode):
+                size += info.st_size
+    return size
+
+
+class Importer(object):
+    """
+    Offline Bulk Importer
+    Copies a host directory tree into a volume that is not mounted,
+    inodes go straight into the metadata tree and blocks straight into
+    the block store. Files are streamed a job at a time, jobs are
+    encrypted on a worker pool and their rows are committed together
+    with the journal once a batch worth of bytes is stored. A file's
+    Inode is recorded empty before its first job and every commit
+    journals the size its stored rows reach, so an interrupted import
+    keeps every file of the committed batches and a file cut by the
+    interruption keeps its committed prefix, no rows without an Inode.
+    All-zero blocks become holes and are never encrypted.
+    Parameters:-
+        fs: SecFS - Volume, not mounted
+        password: bytes
+        compression: str - Codec of the volume, see compression_codec
+        workers: int - Pool size, cpu_count if None
+        executor: str - 'process' or 'thread' pool
+        batch: int - Encrypted bytes per transaction
+        job: int - Blocks per pool job
+    """
+    def __init__(self, fs, password: bytes, compression: str = None,
+                 workers: int = None, executor: str = 'process',
+                 batch: int = 1 << 26, job: int = 64):
+        if executor not in ['process', 'thread']:
+            raise TypeError(f"Importer does not support {executor} executor")
+        self.fs = fs
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.batch = batch
+        self.job = job
+        self.pending = deque()
+        self.written = 0
+        self.grown = {}
+        self.taken = 0
+        self.files = 0
+        self.directories = 0
+        self.skipped = []
+        self.bytes = 0
+        pool = ProcessPoolExecutor if executor == 'process'\
+            else ThreadPoolExecutor
+        self.pool = pool(self.workers, initializer=import_worker,
+                         initargs=(fs.db['auth_key'], password, compression))
+
+    def run(self, source: str, target: str = '/', progress=None) -> dict:
+        '''
+        Import a host directory into a volume directory
+        Args:
+            source: str - Host directory
+            target: str - Existing volume directory
+            progress: callable - progress(bytes) after every job
+
+        Returns:
+            dict - files, directories, skipped, bytes, seconds, mbps
+
+        Raises:
+            NotADirectoryError - If source or target is not a directory
+            FileNotFoundError - If target does not exist
+        '''
+        start = perf_counter()
+        try:
+            source = os.path.abspath(source)
+            if not os.path.isdir(source):
+                raise NotADirectoryError(f'\'{source}\' is not a Directory')
+            if target[-1] != '/':
+                target += '/'
+            try:
+                root = creeper(target, self.fs.FS)
+            except KeyError:
+                raise FileNotFoundError(f'\'{target}\' does not exist')
+            except ValueError:
+                raise NotADirectoryError(f'\'{target}\' is not a Directory')
+            if 0x7F in root:
+                raise NotADirectoryError(f'\'{target}\' is not a Directory')
+            folders = {source: (target, root)}
+            modes = []
+            for host, dirs, files in os.walk(source):
+                path, inode = folders.pop(host)
+                for name in sorted(dirs):
+                    sub = os.path.join(host, name)
+                    if name == '~' or os.path.islink(sub) or (
+                            name in inode and 0x7F in inode[name]):
+                        self.skipped.append(sub)
+                        dirs.remove(name)
+                        continue
+                    if name not in inode:
+                        info = os.lstat(sub)
+                        modes.append((path + name + '/', info))
+                        self.put(path + name, self.head(info, DIRT | WUSR))
+                        self.directories += 1
+                    folders[sub] = (path + name + '/', inode[name])
+                for name in sorted(files):
+                    sub = os.path.join(host, name)
+                    info = os.lstat(sub)
+                    if name == '~' or name in inode or\
+                            not stat.S_ISREG(info.st_mode):
+                        self.skip(sub, info, progress)
+                        continue
+                    try:
+                        file = open(sub, 'rb')
+                    except OSError:
+                        self.skip(sub, info, progress)
+                        continue
+                    with file:
+                        self.copy(file, path + name, info, progress)
+            for path, info in reversed(modes):
+                inode = creeper(path, self.fs.FS)
+                inode[0xFF].update({
+                    'st_mode': info.st_mode,
+                    'st_atime': info.st_atime,
+                    'st_mtime': info.st_mtime
+                })
+                self.fs.journal.record('set', path, 0xFF, inode[0xFF])
+            self.commit(progress)
+        finally:
+            self.pool.shutdown()
+        seconds = perf_counter() - start
+        return {
+            'files': self.files,
+            'directories': self.directories,
+            'skipped': len(self.skipped),
+            'bytes': self.bytes,
+            'seconds': seconds,
+            'mbps': self.bytes / seconds / 1E6 if seconds else 0.0
+        }
+
+    def head(self, info: os.stat_result, extra: int = 0) -> dict:
+        '''
+        Fresh Inode from a host stat
+        '''
+        return {
+            0xFF: {
+                'st_ino': self.fs.allocate_ino(),
+                'st_mode': info.st_mode | extra,
+                'st_uid': self.fs.uid,
+                'st_gid': self.fs.gid,
+                'st_nlink': 0x01,
+                'st_size': 4096,
+                'st_ctime': info.st_ctime,
+                'st_atime': info.st_atime,
+                'st_mtime': info.st_mtime
+            },
+            0xF7: {
+
+            }
+        }
+
+    def put(self, path: str, inode: dict):
+        '''
+        Insert an Inode and journal it like create
+        '''
+        seeper(path + '/~', self.fs.FS, inode)
+        self.fs.journal.record('put', path + '/', inode_head(inode))
+
+    def skip(self, host: str, info: os.stat_result, progress=None):
+        self.skipped.append(host)
+        if progress is not None and stat.S_ISREG(info.st_mode):
+            progress(info.st_size)
+
+    def copy(self, file, path: str, info: os.stat_result, progress=None):
+        '''
+        Stream one open host file into the store, the Inode is put
+        empty first and grows as its jobs are stored
+        '''
+        inode = self.head(info)
+        inode[0xFF]['st_size'] = 0
+        inode[0x7E] = inode[0xFF]['st_ino']
+        inode[0x7F] = {}
+        self.put(path, inode)
+        holes, size = [], 0
+        while True:
+            data = file.read(BLOCK_SIZE * self.job)
+            if not data:
+                break
+            first = size // BLOCK_SIZE
+            blocks = {}
+            for x in range(0, len(data), BLOCK_SIZE):
+                chunk = data[x:x + BLOCK_SIZE]
+                block = first + x // BLOCK_SIZE
+                if chunk.count(0) == len(chunk):
+                    holes = punch(holes, block, block + 1)
+                    inode[0x7D] = holes
+                else:
+                    blocks[block] = chunk
+            size += len(data)
+            if blocks:
+                self.submit(path, inode, blocks, size, len(data), progress)
+            elif progress is not None:
+                progress(len(data))
+        self.grow(path, inode, size)
+        self.files += 1
+        self.bytes += size
+
+    def grow(self, path: str, inode: dict, end: int):
+        '''
+        Extend a file to end, journalled on the next commit
+        '''
+        inode[0xFF]['st_size'] = max(inode[0xFF]['st_size'], end)
+        self.grown[path] = inode
+
+    def submit(self, path: str, inode: dict, blocks: dict, end: int,
+               size: int, progress=None):
+        '''
+        Queue a job, storing the oldest ones while the pool is full
+        and committing once a batch is stored
+        '''
+        self.pending.append((path, inode, blocks, end, size, self.pool.submit(
+            encode_job, list(blocks.values()))))
+        while len(self.pending) > 2 * self.workers:
+            self.store(progress)
+        if self.written >= self.batch:
+            self.commit(progress)
+
+    def store(self, progress=None):
+        '''
+        Store the oldest queued job
+        '''
+        path, inode, blocks, end, size, future = self.pending.popleft()
+        file_id = inode[0x7E]
+        encoded = future.result()
+        if self.fs.blocks.fingerprint is None:
+            self.fs.blocks.update(file_id, dict(zip(blocks, encoded)))
+            self.written += sum(len(x) for x in encoded)
+        else:
+            lookup = dict(zip(blocks.values(), encoded))
+            self.written += self.fs.blocks.store(file_id, blocks,
+                                                 lookup.__getitem__)
+        self.taken += sum(len(x) for x in blocks.values())
+        self.grow(path, inode, end)
+        if progress is not None:
+            progress(size)
+
+    def commit(self, progress=None):
+        '''
+        Store every queued job then commit rows and journal together,
+        with the sizes the stored rows reach
+        '''
+        while self.pending:
+            self.store(progress)
+        for path, inode in self.grown.items():
+            if 0x7D in inode:
+                self.fs.journal.record('set', path, 0x7D, inode[0x7D])
+            self.fs.journal.record('set', path, 0xFF, inode[0xFF])
+        self.grown.clear()
+        if self.taken:
+            self.fs.account(-self.taken)
+        self.written = self.taken = 0
+        self.fs.group_commit()
@@ -0,0 +1,225 @@
+'''
+SQLiteFS Metadata Journal
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import threading
+import dill as pickle
+from .locks import RWLock
+from .metrics import Metrics
+from .coreutils import creeper, seeper, sweeper, dump_fs
+
+
+def inode_head(inode: dict) -> dict:
+    '''
+    Inode without children or dirty blocks
+    '''
+    head = {x: inode[x] for x in inode if type(x) != str and x != 0x7F}
+    if 0x7F in inode:
+        head[0x7F] = {}
+    return head
+
+
+def replay(record: tuple, hash_table: dict):
+    '''
+    Apply a Journal Record to the Hash Table
+    Args:
+        record: tuple - (op, path, *args)
+        hash_table: dict - Hash Table to Replay into
+    '''
+    op, path = record[0], record[1]
+    if op == 'put':
+        seeper(path + '~', hash_table, record[2])
+    elif op == 'set':
+        inode = hash_table if path is None else creeper(path, hash_table)
+        inode[record[2]] = record[3]
+    elif op == 'mv':
+        inode = creeper(path, hash_table)
+        seeper(record[2] + '~', hash_table, inode)
+        sweeper(path, hash_table)
+    elif op == 'rm':
+        sweeper(path, hash_table)
+    else:
+        raise ValueError(f'Unknown Journal Record \'{op}\'')
+
+
+class Journal(object):
+    """
+    Append Only Encrypted Metadata Journal
+    Inode mutations are recorded as they happen, appended as one
+    DOPE row per commit and folded into the snapshot by checkpoints
+    Parameters:-
+        db: Storage - Volume Store
+        volume_name: str
+        keyring: KeyContext
+        interval: float - Seconds between background checkpoints
+        limit: int - Journal rows that trigger an early checkpoint
+        tree: RWLock - Namespace lock held exclusively while snapshotting
+        metrics: Metrics - Phase timings
+        dirty: callable - dirty(size) after every Record, see Flusher
+    """
+    def __init__(self, db, volume_name: str, keyring,
+                 interval: float = 60.0, limit: int = 1024, tree=None,
+                 metrics=None, dirty=None):
+        self.db = db
+        self.volume_name = volume_name
+        self.keyring = keyring
+        self.interval = interval
+        self.limit = limit
+        self.tree = tree if tree is not None else RWLock()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.dirty = dirty
+        self.lock = threading.RLock()
+        self.folding = threading.Lock()
+        self.pending = []
+        self.fs = None
+        self.head = f'{volume_name}:journal'
+        try:
+            self.first, self.next = self.db[self.head]
+        except KeyError:
+            self.first, self.next = 0, 0
+        self.__wake = threading.Event()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def key(self, seq: int) -> str:
+        return f'{self.head}:{seq:016x}'
+
+    def __len__(self):
+        return self.next - self.first
+
+    def record(self, op: str, path: str, *args):
+        '''
+        Record an Inode Mutation, serialized at call time
+        '''
+        with self.metrics.phase('serialization'):
+            record = pickle.dumps((op, path) + args)
+        with self.lock:
+            self.pending.append(record)
+        if self.dirty is not None:
+            self.dirty(len(record))
+
+    def commit(self):
+        '''
+        Append pending Records as a single Journal row
+        '''
+        with self.lock:
+            if not self.pending:
+                return
+            self.append()
+            full = len(self) >= self.limit
+        if full:
+            if self.__thread is not None:
+                self.__wake.set()
+            else:
+                self.checkpoint()
+
+    def append(self):
+        '''
+        Write pending Records as the next row, caller holds the lock
+        '''
+        with self.metrics.phase('serialization'):
+            data = pickle.dumps(self.pending)
+        with self.keyring.codec() as dopex,\
+                self.metrics.phase('crypto', len(data)):
+            self.db[self.key(self.next)] = dopex.encode(data)
+        self.next += 1
+        self.db[self.head] = (self.first, self.next)
+        self.pending = []
+
+    def load(self, hash_table: dict) -> dict:
+        '''
+        Replay every Journal row into the snapshot
+        and track it for Checkpoints
+        '''
+        with self.keyring.codec() as dopex:
+            for seq in range(self.first, self.next):
+                for record in pickle.loads(dopex.decode(
+                        self.db[self.key(seq)])):
+                    replay(pickle.loads(record), hash_table)
+        self.fs = hash_table
+        return hash_table
+
+    def checkpoint(self):
+        '''
+        Fold the Journal into a full Snapshot
+        The tree is serialized under the namespace lock, pending
+        Records are appended first so every row below the snapshot
+        sequence is covered by it. Encryption runs after the lock is
+        released and rows appended meanwhile stay in the Journal.
+        '''
+        with self.folding:
+            with self.tree.write(), self.lock:
+                if self.pending:
+                    self.append()
+                upto = self.next
+                with self.metrics.phase('serialization'):
+                    data = dump_fs(self.fs)
+            with self.keyring.codec() as dopex,\
+                    self.metrics.phase('crypto', len(data)):
+                data = dopex.encode(data)
+            with self.lock:
+                self.db.put_many({
+                    self.volume_name: data,
+                    self.head: (upto, self.next)
+                })
+                self.db.delete_many([
+                    self.key(seq) for seq in range(self.first, upto)
+                ])
+                self.first = upto
+            with self.metrics.phase('sqlite'):
+                self.db.commit()
+
+    def start(self):
+        '''
+        Start the background Checkpoint thread
+        '''
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.run, daemon=True,
+                                         name=f'{self.head}:checkpoint')
+        self.__thread.start()
+
+    def stop(self):
+        '''
+        Stop the background Checkpoint thread
+        '''
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__wake.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def run(self):
+        while not self.__stop.is_set():
+            self.__wake.wait(self.interval)
+            self.__wake.clear()
+            if self.__stop.is_set():
+                break
+            if len(self) or self.pending:
+                self.checkpoint()
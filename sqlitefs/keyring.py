@@ -0,0 +1,95 @@
+'''
+SQLiteFS DOPE Key Context
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+from typing import Union
+from .dope import DOPE2, compression_codec
+
+
+class KeyContext(object):
+    """
+    Mount Scoped DOPE Key Context
+    Marshalls the volume key once per mount and keeps a
+    thread-safe pool of ready-to-use DOPE2 codecs
+    Parameters:-
+        key: bytes - Serialized DOPE Key
+        password: bytes
+        pool_size: int - Maximum idle codecs kept in the pool
+        compression: str - Codec of the pooled codecs, None for none
+    """
+    def __init__(self, key: Union[str, bytes], password: bytes,
+                 pool_size: int = 8, compression: str = None):
+        self.__template = DOPE2.marshall(key, password)
+        self.__template.compression = compression_codec(compression)
+        self.__pool = LifoQueue(maxsize=pool_size)
+        self.pool_size = pool_size
+
+    def __str__(self):
+        return f'KeyContext_{self.__template}_POOL_{self.pool_size}'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def acquire(self) -> DOPE2:
+        '''
+        Take a Codec from the Pool, spawn one if the Pool is dry
+        '''
+        try:
+            dopex = self.__pool.get_nowait()
+        except Empty:
+            dopex = self.__template.clone()
+        dopex.fixate()
+        return dopex
+
+    def release(self, dopex: DOPE2):
+        '''
+        Return a Codec to the Pool, drop it if the Pool is full
+        '''
+        try:
+            self.__pool.put_nowait(dopex)
+        except Full:
+            pass
+
+    def fingerprint_key(self) -> bytes:
+        '''
+        Volume Key for content fingerprints
+        '''
+        with self.codec() as dopex:
+            return dopex.fingerprint_key()
+
+    @contextmanager
+    def codec(self):
+        '''
+        Borrow a fixated Codec for the duration of the block
+        '''
+        dopex = self.acquire()
+        try:
+            yield dopex
+        finally:
+            self.release(dopex)
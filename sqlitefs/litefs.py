@@ -30,11 +30,34 @@ import fuse
 from .coreutils import *
 from datetime import datetime
 import logging
+import threading
 import errno
-from sqlitedict import SqliteDict
+from .storage import Storage, storage_options, STORAGE_DEFAULTS
 from hashlib import blake2s
 from base64 import urlsafe_b64encode
 from .dope import DOPE2
+from .keyring import KeyContext
+from .tuner import make_dope
+from .journal import Journal, inode_head
+from .writeback import WriteBack
+from .readahead import ReadAhead
+from .flusher import Flusher
+from .locks import RWLock, LockTable
+from .metrics import MetricsMixIn
+from .blockstore import (
+    BLOCK_SIZE,
+    LAYOUT_BLOCKS,
+    BlockStore,
+    BlockCache,
+    keyed_fingerprint,
+    block_span,
+    block_count,
+    is_hole,
+    fill,
+    punch,
+    extents,
+    held
+)
 
 
 def blake2_uuid(data: bytes) -> str:
@@ -45,22 +68,25 @@ def blake2_uuid(data: bytes) -> str:
     return f'{hash_data}'
 
 
-class SecFS(fuse.LoggingMixIn, fuse.Operations):
+class SecFS(MetricsMixIn, fuse.Operations):
     """
     SecFS Filesystem Bridge Programmes written with FUSE
     """
     def __init__(self, name: str, password: bytes, volume_name: str,
-                 size: int = 1E9):
+                 size: int = 1E9, dirty_budget: int = 1 << 26,
+                 cache_size: int = 1 << 26, readahead: int = 0,
+                 commit_interval: float = 1.0, storage: dict = None,
+                 profile: str = 'default', dedup: bool = False,
+                 compression: str = None):
         import os
         self.volume_name = volume_name
         self.__password = password
-        self.db = SqliteDict(os.path.abspath(
-            f"./{name}" + ".db"), autocommit=False, tablename=self.volume_name)
+        self.db = Storage(os.path.abspath(f"./{name}" + ".db"),
+                          self.volume_name, **(storage or {}))
         try:
             self.dopex = DOPE2.marshall(self.db['auth_key'], password)
         except KeyError:
-            self.dopex = DOPE2(password, 8219, 32, 'GCM', b'',
-                               block_size=512)
+            self.dopex = make_dope(password, profile)
             self.db['auth_key'] = self.dopex.serialize()
         try:
             self.dopex.fixate()
@@ -71,31 +97,174 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
             self.dopex = DOPE2.marshall(self.db['auth_key'], password)
             self.dopex.fixate()
             self.FS = load_fs(self.dopex.decode(self.db[volume_name]))
+        self.keyring = KeyContext(self.db['auth_key'], password,
+                                  compression=compression)
+        self.init_metrics(name)
+        self.tree = RWLock()
+        self.locks = LockTable()
+        self.counters = threading.Lock()
+        self.flusher = Flusher(self.group_commit, commit_interval)
+        self.journal = Journal(self.db, volume_name, self.keyring,
+                               tree=self.tree, metrics=self.metrics,
+                               dirty=self.flusher.dirty)
+        self.FS = self.journal.load(self.FS)
+        self.blocks = BlockStore(self.db, keyed_fingerprint(
+            self.keyring.fingerprint_key()) if dedup else None)
+        self.writeback = WriteBack(self.spill, dirty_budget)
+        self.cache = BlockCache(cache_size)
+        self.readahead = ReadAhead(self.prefetch, readahead)
+        self.dcache = DentryCache()
+        for source in ('blocks', 'writeback', 'cache', 'readahead',
+                       'flusher', 'dcache'):
+            self.metrics.register(source, getattr(self, source).stats)
         self.uid = os.getuid()
         self.gid = os.getgid()
+        if self.FS.get(0xF6, {}).get('layout') != LAYOUT_BLOCKS:
+            self.migrate_blobs()
+
+    def migrate_blobs(self):
+        '''
+        Migrate one-blob-per-file volumes to the block layout, every
+        file is committed with its Journal records so an interrupted
+        migration resumes at the first file still holding a blob
+        '''
+        self.FS.setdefault(0xF6, {'next_ino': 1})
+        with self.keyring.codec() as dopex:
+            for path, inode in walker(self.FS):
+                if 0x7F not in inode or isinstance(inode.get(0x7E), int):
+                    continue
+                blob = inode.get(0x7E)
+                chunks = {}
+                if blob is not None and blob in self.db:
+                    chunks.update(self.db[blob])
+                chunks.update(inode[0x7F])
+                size = inode[0xFF]['st_size']
+                data_buff = bytearray(size)
+                for offset in sorted(chunks):
+                    if offset >= size or chunks[offset] == b'':
+                        continue
+                    chunk = dopex.decode(chunks[offset])
+                    data_buff[offset:offset + len(chunk)] = chunk
+                del data_buff[size:]
+                if blob is not None and blob in self.db:
+                    del self.db[blob]
+                inode[0x7E] = self.allocate_ino()
+                inode[0x7F] = {}
+                for block in range(block_count(size)):
+                    self.blocks.put(inode[0x7E], block, dopex.encode(
+                        bytes(data_buff[block * BLOCK_SIZE:
+                                        (block + 1) * BLOCK_SIZE])))
+                self.journal.record('set', path, 0x7E, inode[0x7E])
+                self.journal.record('set', path, 0x7F, inode[0x7F])
+                self.group_commit()
+        self.FS[0xF6]['layout'] = LAYOUT_BLOCKS
+        self.journal.record('set', None, 0xF6, self.FS[0xF6])
+        self.journal.checkpoint()
+
+    def allocate_ino(self) -> int:
+        '''
+        Next stable Inode ID, independent of the path
+        '''
+        with self.counters:
+            ino = self.FS[0xF6].get('next_ino', 1)
+            self.FS[0xF6]['next_ino'] = ino + 1
+            self.journal.record('set', None, 0xF6, self.FS[0xF6])
+        return ino
+
+    def account(self, size: int):
+        '''
+        Atomically give back (size > 0) or take (size < 0) space
+        and journal the statfs
+        '''
+        sign, size = (1, size) if size >= 0 else (-1, -size)
+        with self.counters:
+            self.FS[0xF8]['f_bfree'] += sign * (size // 512)
+            self.FS[0xF8]['f_ffree'] += sign * (size // 4096)
+            self.FS[0xF8]['f_favail'] += sign * (size // 4096)
+            self.FS[0xF8]['f_bavail'] += sign * (size // 512)
+            self.journal.record('set', None, 0xF8, self.FS[0xF8])
+
+    def spill(self, file_id: int, blocks: dict):
+        '''
+        Encrypt dirty blocks into the store
+        '''
+        with self.keyring.codec() as dopex, self.metrics.phase('crypto'):
+            written = self.blocks.store(file_id, blocks, dopex.encode)
+        self.flusher.dirty(written)
+
+    def group_commit(self):
+        '''
+        Append pending Journal records and commit the volume
+        '''
+        self.journal.commit()
+        with self.metrics.phase('sqlite'):
+            self.db.commit()
+
+    def load_block(self, inode, block, dopex) -> bytes:
+        '''
+        Plaintext of a block, write-back buffer first then store.
+        The cache generation is taken before the buffer is checked
+        so a block written while the store is read is not cached
+        stale, prefetch calls this without the inode lock.
+        '''
+        if 0x7E in inode:
+            generation = self.cache.generation(inode[0x7E])
+            data = self.writeback.get(inode[0x7E], block)
+            if data is not None:
+                return bytes(data)
+        if is_hole(inode.get(0x7D), block):
+            return b''
+        data = self.cache.get(inode[0x7E], block)
+        if data is not None:
+            return data
+        with self.metrics.phase('sqlite'):
+            data = self.blocks.get(inode[0x7E], block)
+        if data is None:
+            return b''
+        with self.metrics.phase('crypto', len(data)):
+            data = dopex.decode(data)
+        self.cache.put(inode[0x7E], block, data, generation)
+        return data
+
+    def prefetch(self, inode, block):
+        '''
+        Read-ahead worker, decodes a block into the cache
+        '''
+        with self.keyring.codec() as dopex:
+            self.load_block(inode, block, dopex)
 
     def access(self, path, mode):
-        try:
-            inode = creeper(path, self.FS)
-        except Exception:
-            raise fuse.FuseOSError(errno.EFAULT)
-        if inode[0xFF]['st_uid'] == self.uid:
-            if (inode[0xFF]['st_mode'] >> 6) & mode:
+        with self.tree.read():
+            try:
+                inode = self.dcache.lookup(path, self.FS)
+            except Exception:
+                raise fuse.FuseOSError(errno.EFAULT)
+            with self.locks.read(inode):
+                head = dict(inode[0xFF])
+        if head['st_uid'] == self.uid:
+            if (head['st_mode'] >> 6) & mode:
                 return 0
             raise fuse.FuseOSError(errno.EACCES)
-        elif inode[0xFF]['st_gid'] == self.gid:
-            if (inode[0xFF]['st_mode'] >> 3) & mode:
+        elif head['st_gid'] == self.gid:
+            if (head['st_mode'] >> 3) & mode:
                 return 0
             raise fuse.FuseOSError(errno.EACCES)
         else:
-            if (inode[0xFF]['st_mode']) & mode:
+            if (head['st_mode']) & mode:
                 return 0
             raise fuse.FuseOSError(errno.EACCES)
 
+    def init(self, path):
+        self.journal.start()
+        self.flusher.start()
+
     def destroy(self, *args):
+        self.readahead.shutdown()
+        self.flusher.stop()
+        self.journal.stop()
+        self.writeback.flush_all()
         self.db['auth_key'] = self.dopex.serialize()
-        self.db[self.volume_name] = self.dopex.encode(dump_fs(self.FS))
-        self.db.commit()
+        self.journal.checkpoint()
         self.db.close()
         pass
 
@@ -105,12 +274,14 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        try:
-            inode = creeper(path, self.FS)
-            head = inode[0xFF]
+        with self.tree.read():
+            try:
+                inode = self.dcache.lookup(path, self.FS)
+            except KeyError:
+                raise fuse.FuseOSError(errno.ENOENT)
+            with self.locks.read(inode):
+                head = dict(inode[0xFF])
             return head
-        except KeyError:
-            raise fuse.FuseOSError(errno.ENOENT)
 
     def getxattr(self, path, name, fh=None):
         '''
@@ -118,12 +289,14 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        head = inode[0xF7]
-        try:
-            return head[name] or b''
-        except KeyError:
-            return b''
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.read(inode):
+                head = inode[0xF7]
+                try:
+                    return head[name] or b''
+                except KeyError:
+                    return b''
 
     def setxattr(self, path, name, value, size, fh=None):
         '''
@@ -131,8 +304,11 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        inode[0xF7][name] = value
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.write(inode):
+                inode[0xF7][name] = value
+                self.journal.record('set', path, 0xF7, inode[0xF7])
 
     def chmod(self, path, mode):
         '''
@@ -140,8 +316,11 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        inode[0xFF]['st_mode'] = mode
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.write(inode):
+                inode[0xFF]['st_mode'] = mode
+                self.journal.record('set', path, 0xFF, inode[0xFF])
         return 0
 
     def chown(self, path, uid, gid):
@@ -150,9 +329,12 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        inode[0xFF]['st_uid'] = uid
-        inode[0xFF]['st_gid'] = gid
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.write(inode):
+                inode[0xFF]['st_uid'] = uid
+                inode[0xFF]['st_gid'] = gid
+                self.journal.record('set', path, 0xFF, inode[0xFF])
         return 0
 
     def create(self, path, mode):
@@ -164,6 +346,7 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         time_var = datetime.now()
         dir_inode = {
             0xFF: {
+                'st_ino': self.allocate_ino(),
                 'st_mode': mode,
                 'st_uid': self.uid,
                 'st_gid': self.gid,
@@ -178,12 +361,34 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
             }
         }
         if mode & REGF:
-            dir_inode[0x7F] = {
-                0: b''
-            }
+            dir_inode[0x7E] = dir_inode[0xFF]['st_ino']
+            dir_inode[0x7F] = {}
             dir_inode[0xFF]['st_size'] = 0
-        seeper(path, self.FS, dir_inode)
-        return 1
+        with self.tree.write():
+            seeper(path, self.FS, dir_inode)
+            self.dcache.invalidate(path[:-1])
+            self.journal.record('put', path[:-1], inode_head(dir_inode))
+        return self.readahead.open()
+
+    def open(self, path, flags):
+        '''
+        Open a File Handle
+        '''
+        if path[-1] != '/':
+            path += '/'
+        with self.tree.read():
+            try:
+                self.dcache.lookup(path, self.FS)
+            except KeyError:
+                raise fuse.FuseOSError(errno.ENOENT)
+        return self.readahead.open()
+
+    def release(self, path, fh):
+        '''
+        Close a File Handle
+        '''
+        self.readahead.close(fh)
+        return 0
 
     def flush(self, path, fh):
         '''
@@ -191,28 +396,30 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        uuid_inode = blake2_uuid(path.encode('utf8'))
-        if uuid_inode not in self.db:
-            inode[0x7E] = uuid_inode
-            self.db[uuid_inode] = {}
-        data = self.db[inode[0x7E]]
-        data.update(inode[0x7F])
-        data = dict(filter(lambda x: x[0] < inode[0xFF]['st_size'],
-                           data.items()))
-        self.db[inode[0x7E]] = data
-        inode[0x7F] = {}
-        self.dopex.fixate()
-        self.db[self.volume_name] = self.dopex.encode(dump_fs(self.FS))
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.write(inode):
+                if 0x7F in inode and 0x7E in inode:
+                    self.writeback.flush(inode[0x7E])
+                    self.journal.record('set', path, 0x7E, inode[0x7E])
+                self.journal.record('set', path, 0xFF, inode[0xFF])
+        self.account(0)
         return 0
 
     def fsync(self, path, datasync, fh):
         '''
         Sync Force Commit
         '''
-        self.dopex.fixate()
-        self.db[self.volume_name] = self.dopex.encode(dump_fs(self.FS))
-        self.db.commit()
+        if path[-1] != '/':
+            path += '/'
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.write(inode):
+                if 0x7E in inode:
+                    self.writeback.flush(inode[0x7E])
+                self.journal.record('set', path, 0xFF, inode[0xFF])
+        self.account(0)
+        self.flusher.sync()
         return 0
 
     def readdir(self, path, fh):
@@ -221,7 +428,8 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        return ['.', '..'] + lister(path, self.FS)
+        with self.tree.read():
+            return ['.', '..'] + lister(path, self.FS)
 
     def mkdir(self, path, mode):
         '''
@@ -232,6 +440,7 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         time_var = datetime.now()
         dir_inode = {
             0xFF: {
+                'st_ino': self.allocate_ino(),
                 'st_mode': mode + DIRT,
                 'st_uid': self.uid,
                 'st_gid': self.gid,
@@ -245,7 +454,10 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
 
             }
         }
-        seeper(path, self.FS, dir_inode)
+        with self.tree.write():
+            seeper(path, self.FS, dir_inode)
+            self.dcache.invalidate(path[:-1])
+            self.journal.record('put', path[:-1], inode_head(dir_inode))
 
     def read(self, path, size, offset, fh):
         '''
@@ -253,29 +465,26 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        try:
-            if inode[0x7F] != {}:
-                dopex = DOPE2.marshall(self.db['auth_key'], self.__password)
-                dopex.fixate()
-                data_buff = b''.join([dopex.decode(inode[0x7F][x])
-                                      for x in inode[0x7F]
-                                      if x >= offset and x <= offset + size])
-                del dopex
-                return data_buff[:size]
-            elif 0x7E in inode:
-                dopex = DOPE2.marshall(self.db['auth_key'], self.__password)
-                dopex.fixate()
-                inode[0x7F] = self.db[inode[0x7E]]
-                data_buff = b''.join([dopex.decode(inode[0x7F][x])
-                                      for x in inode[0x7F]
-                                      if x >= offset and x <= offset + size])
-                del dopex
-                return data_buff[:size]
-            else:
-                return b''
-        except KeyError:
-            raise fuse.FuseOSError(errno.EISDIR)
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            if 0x7F not in inode:
+                raise fuse.FuseOSError(errno.EISDIR)
+            with self.locks.read(inode):
+                size = min(size, inode[0xFF]['st_size'] - offset)
+                if size <= 0:
+                    return b''
+                span = block_span(offset, size)
+                self.readahead.access(fh, inode, offset, size,
+                                      block_count(inode[0xFF]['st_size']))
+                self.readahead.wait(inode[0x7E], span)
+                with self.keyring.codec() as dopex:
+                    data_buff = b''.join([
+                        self.load_block(inode, x, dopex).ljust(BLOCK_SIZE,
+                                                               b'\x00')
+                        for x in span
+                    ])
+        start = offset - span.start * BLOCK_SIZE
+        return data_buff[start:start + size]
 
     def write(self, path, data, offset, fh):
         '''
@@ -283,27 +492,118 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        if 0x7E not in inode:
-            inode[0x7E] = blake2_uuid(path.encode('utf8'))
-            self.db[inode[0x7E]] = {}
-        try:
-            dopex = DOPE2.marshall(self.db['auth_key'], self.__password)
-            dopex.fixate()
-            inode[0x7F][offset] = dopex.encode(data)
-            inode[0xFF]['st_size'] += len(data)
-            self.FS[0xF8]['f_bfree'] -= int(len(data) / 512)\
-                if len(data) / 512 >= 1 else 0
-            self.FS[0xF8]['f_ffree'] -= int(len(data) / 4096)\
-                if len(data) / 4096 >= 1 else 0
-            self.FS[0xF8]['f_favail'] -= int(len(data) / 4096)\
-                if len(data) / 4096 >= 1 else 0
-            self.FS[0xF8]['f_bavail'] -= int(len(data) / 512)\
-                if len(data) / 512 >= 1 else 0
-            del dopex
-            return len(data)
-        except KeyError:
-            return 0
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.write(inode):
+                if 0x7E not in inode:
+                    inode[0x7E] = self.allocate_ino()
+                span = block_span(offset, len(data))
+                self.reshape(path, inode, span.start, span.stop)
+                try:
+                    with self.keyring.codec() as dopex:
+                        for x in span:
+                            start = max(offset, x * BLOCK_SIZE)
+                            end = min(offset + len(data), (x + 1) * BLOCK_SIZE)
+                            chunk = data[start - offset:end - offset]
+                            block = self.writeback.get(inode[0x7E], x)
+                            if block is None:
+                                block = bytearray()\
+                                    if len(chunk) == BLOCK_SIZE\
+                                    else bytearray(self.load_block(
+                                        inode, x, dopex))
+                            block.extend(bytes(
+                                max(0, end - x * BLOCK_SIZE - len(block))))
+                            block[start - x * BLOCK_SIZE:
+                                  end - x * BLOCK_SIZE] = chunk
+                            self.writeback.put(inode[0x7E], x, block)
+                    self.cache.invalidate(inode[0x7E], span.start, span.stop)
+                    self.writeback.balance()
+                    inode[0xFF]['st_size'] = max(inode[0xFF]['st_size'],
+                                                 offset + len(data))
+                except KeyError:
+                    return 0
+        self.account(-len(data))
+        return len(data)
+
+    def reshape(self, path, inode, start, end):
+        '''
+        Blocks [start, end) are about to hold data, any gap past
+        the end of the file becomes a hole
+        '''
+        holes = inode.get(0x7D)
+        tail = block_count(inode[0xFF]['st_size'])
+        if not holes and start <= tail:
+            return
+        holes = fill(punch(holes, tail, start), start, end)
+        if holes != inode.get(0x7D):
+            inode[0x7D] = holes
+            self.journal.record('set', path, 0x7D, holes)
+
+    def fallocate(self, path, mode, offset, size, fh=None):
+        '''
+        Preallocate as holes or Punch Holes
+        '''
+        if mode & ~(FALLOC_FL_KEEP_SIZE | FALLOC_FL_PUNCH_HOLE):
+            raise fuse.FuseOSError(errno.EOPNOTSUPP)
+        if path[-1] != '/':
+            path += '/'
+        freed = 0
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            if 0x7F not in inode:
+                raise fuse.FuseOSError(errno.EISDIR)
+            with self.locks.write(inode):
+                if 0x7E not in inode:
+                    inode[0x7E] = self.allocate_ino()
+                file_size = inode[0xFF]['st_size']
+                if not mode & FALLOC_FL_PUNCH_HOLE:
+                    if not mode & FALLOC_FL_KEEP_SIZE and\
+                            offset + size > file_size:
+                        self.reshape(path, inode,
+                                     block_count(offset + size),
+                                     block_count(offset + size))
+                        inode[0xFF]['st_size'] = offset + size
+                        self.journal.record('set', path, 0xFF, inode[0xFF])
+                    return 0
+                end = min(offset + size, file_size)
+                if offset >= end:
+                    return 0
+                start, stop = block_count(offset), end // BLOCK_SIZE
+                if end == file_size:
+                    stop = block_count(end)
+                if start > stop:
+                    edges = [(offset, end)]
+                else:
+                    edges = [(offset, min(start * BLOCK_SIZE, end)),
+                             (stop * BLOCK_SIZE, end)]
+                with self.keyring.codec() as dopex:
+                    for lo, hi in edges:
+                        if lo >= hi:
+                            continue
+                        x = lo // BLOCK_SIZE
+                        if is_hole(inode.get(0x7D), x):
+                            continue
+                        block = self.writeback.get(inode[0x7E], x)
+                        if block is None:
+                            block = bytearray(self.load_block(inode, x,
+                                                              dopex))
+                        lo, hi = lo - x * BLOCK_SIZE, hi - x * BLOCK_SIZE
+                        block[lo:hi] = bytes(len(block[lo:hi]))
+                        self.writeback.put(inode[0x7E], x, block)
+                        self.cache.invalidate(inode[0x7E], x, x + 1)
+                if start < stop:
+                    holes = inode.get(0x7D)
+                    freed = held(holes, start * BLOCK_SIZE,
+                                 min(stop * BLOCK_SIZE, file_size))
+                    for lo, hi in extents(holes, start, stop):
+                        self.writeback.drop(inode[0x7E], lo, hi)
+                        self.blocks.drop(inode[0x7E], lo, hi)
+                    self.cache.invalidate(inode[0x7E], start, stop)
+                    inode[0x7D] = punch(holes, start, stop)
+                    self.journal.record('set', path, 0x7D, inode[0x7D])
+                self.writeback.balance()
+        self.account(freed)
+        return 0
 
     def rename(self, old, new):
         '''
@@ -311,15 +611,23 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if old[-1] != '/':
             old += '/'
-        inode = creeper(old, self.FS)
         if new[-1] != '/':
             new += '/'
-        seeper(new+'~', self.FS, inode)
-        if blake2_uuid(old.encode('utf8')) in self.db:
-            self.db[blake2_uuid(new.encode('utf8'))] = self.db[
-                blake2_uuid(old.encode('utf8'))
-            ]
-        sweeper(old, self.FS)
+        freed = 0
+        with self.tree.write():
+            inode = self.dcache.lookup(old, self.FS)
+            try:
+                target = self.dcache.lookup(new, self.FS)
+            except KeyError:
+                target = None
+            if target is not None and target is not inode:
+                freed = self.discard(target)
+            seeper(new+'~', self.FS, inode)
+            sweeper(old, self.FS)
+            self.dcache.invalidate(old, subtree=True)
+            self.dcache.invalidate(new, subtree=True)
+            self.journal.record('mv', old, new)
+        self.account(freed)
         return 0
 
     def rmdir(self, path):
@@ -328,11 +636,15 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        dir_list = lister(path, self.FS)
-        if len(dir_list) > 0:
-            raise fuse.FuseOSError(errno.ENOTEMPTY)
-        else:
-            sweeper(path, self.FS)
+        with self.tree.write():
+            dir_list = lister(path, self.FS)
+            if len(dir_list) > 0:
+                raise fuse.FuseOSError(errno.ENOTEMPTY)
+            else:
+                self.locks.drop(self.dcache.lookup(path, self.FS))
+                sweeper(path, self.FS)
+                self.dcache.invalidate(path, subtree=True)
+                self.journal.record('rm', path)
 
     def removexattr(self, path, name):
         '''
@@ -340,43 +652,58 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        inode[0xF7].pop(name, None)
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.write(inode):
+                inode[0xF7].pop(name, None)
+                self.journal.record('set', path, 0xF7, inode[0xF7])
 
     def truncate(self, path, length, fh=None):
         '''
-        Truncate Files
+        Truncate Files, growing only moves the end of file
+        and leaves a hole, shrinking drops whole blocks and
+        rewrites the boundary block alone
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        if 0x7F in inode:
-            if inode[0x7F] != {}:
-                data_buff = b''.join([inode[0x7F][x] for x in inode[0x7F]])
-                data_buff = data_buff[:length]
-                inode[0x7F] = {x: data_buff[x:x+4096]
-                               for x in range(0, len(data_buff), 4096)}
-            else:
-                if 0x7E in inode:
-                    dopex = DOPE2.marshall(self.db['auth_key'], self.__password)
-                    dopex.fixate()
-                    data_buff = b''.join([dopex.decode(inode[0x7F][x])
-                                          for x in self.db[inode[0x7E]]])
-                    data_buff = data_buff[:length]
-                    inode[0x7F] = {x: data_buff[x:x+4096]
-                                   for x in range(0, len(data_buff), 4096)}
-            size = (inode[0xFF]['st_size'] - length)
-            self.FS[0xF8]['f_bfree'] += int(size / 512)\
-                if size / 512 >= 1 else 0
-            self.FS[0xF8]['f_ffree'] += int(size / 4096)\
-                if size / 4096 >= 1 else 0
-            self.FS[0xF8]['f_favail'] += int(size / 4096)\
-                if size / 4096 >= 1 else 0
-            self.FS[0xF8]['f_bavail'] += int(size / 512)\
-                if size / 512 >= 1 else 0
-            inode[0xFF]['st_size'] = length
-        else:
-            raise fuse.FuseOSError(errno.EISDIR)
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            if 0x7F not in inode:
+                raise fuse.FuseOSError(errno.EISDIR)
+            with self.locks.write(inode):
+                if 0x7E not in inode:
+                    inode[0x7E] = self.allocate_ino()
+                size = inode[0xFF]['st_size']
+                if length >= size:
+                    self.reshape(path, inode, block_count(length),
+                                 block_count(length))
+                    inode[0xFF]['st_size'] = length
+                    self.journal.record('set', path, 0x7E, inode[0x7E])
+                    self.journal.record('set', path, 0xFF, inode[0xFF])
+                    return
+                count, keep = block_count(size), block_count(length)
+                holes = inode.get(0x7D)
+                boundary = length // BLOCK_SIZE
+                tail = None
+                if length % BLOCK_SIZE and not is_hole(holes, boundary):
+                    with self.keyring.codec() as dopex:
+                        tail = self.load_block(inode, boundary, dopex)
+                freed = held(holes, length, size)
+                self.writeback.drop(inode[0x7E], keep)
+                self.cache.invalidate(inode[0x7E], boundary)
+                if tail is not None:
+                    self.writeback.put(inode[0x7E], boundary, bytearray(
+                        tail[:length % BLOCK_SIZE]))
+                for lo, hi in extents(holes, keep, count):
+                    self.blocks.drop(inode[0x7E], lo, hi)
+                if holes:
+                    inode[0x7D] = fill(holes, keep, count)
+                    self.journal.record('set', path, 0x7D, inode[0x7D])
+                inode[0xFF]['st_size'] = length
+                self.journal.record('set', path, 0x7E, inode[0x7E])
+                self.journal.record('set', path, 0xFF, inode[0xFF])
+                self.account(freed)
+        self.writeback.balance()
 
     def utimens(self, path, times):
         '''
@@ -386,9 +713,12 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         atime, mtime = times if times else (time_var, time_var)
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        inode[0xFF]['st_atime'] = atime
-        inode[0xFF]['st_mtime'] = mtime
+        with self.tree.read():
+            inode = self.dcache.lookup(path, self.FS)
+            with self.locks.write(inode):
+                inode[0xFF]['st_atime'] = atime
+                inode[0xFF]['st_mtime'] = mtime
+                self.journal.record('set', path, 0xFF, inode[0xFF])
 
     def unlink(self, path):
         '''
@@ -396,19 +726,35 @@ class SecFS(fuse.LoggingMixIn, fuse.Operations):
         '''
         if path[-1] != '/':
             path += '/'
-        inode = creeper(path, self.FS)
-        if blake2_uuid(path.encode('utf8')) in self.db:
+        with self.tree.write():
+            inode = self.dcache.lookup(path, self.FS)
+            freed = self.discard(inode)
+            sweeper(path, self.FS)
+            self.dcache.invalidate(path)
+            self.journal.record('rm', path)
+        self.account(freed)
+
+    def discard(self, inode) -> int:
+        '''
+        Drop the blocks, buffered writes and lock of an Inode
+        about to leave the tree, caller holds the tree lock
+        Returns:
+            int - Bytes given back, holes were never taken
+        '''
+        freed = 0
+        if 0x7E in inode:
             size = inode[0xFF]['st_size']
-            self.FS[0xF8]['f_bfree'] += int(size / 512)\
-                if size / 512 >= 1 else 0
-            self.FS[0xF8]['f_ffree'] += int(size / 4096)\
-                if size / 4096 >= 1 else 0
-            self.FS[0xF8]['f_favail'] += int(size / 4096)\
-                if size / 4096 >= 1 else 0
-            self.FS[0xF8]['f_bavail'] += int(size / 512)\
-                if size / 512 >= 1 else 0
-            del self.db[blake2_uuid(path.encode('utf8'))]
-        sweeper(path, self.FS)
+            freed = held(inode.get(0x7D), 0, size)
+            self.writeback.drop(inode[0x7E])
+            self.cache.invalidate(inode[0x7E])
+            for lo, hi in extents(inode.get(0x7D), 0, block_count(size)):
+                self.blocks.drop(inode[0x7E], lo, hi)
+        self.locks.drop(inode)
+        return freed
 
     def statfs(self, path):
-        return self.FS[0xF8]
+        with self.counters:
+            stats = dict(self.FS[0xF8])
+        if self.blocks.shared:
+            stats.update(self.blocks.stats())
+        return stats
@@ -0,0 +1,130 @@
+'''
+SQLiteFS Locks
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import threading
+from contextlib import contextmanager
+
+
+class RWLock(object):
+    """
+    Reader Writer Lock
+    Any number of readers or one writer, a waiting writer holds off
+    new readers. The writer may re-enter and may also take the read side.
+    """
+    def __init__(self):
+        self.__cond = threading.Condition()
+        self.__readers = 0
+        self.__waiting = 0
+        self.__writer = None
+        self.__depth = 0
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self.__cond:
+            if self.__writer == me:
+                self.__depth += 1
+                return
+            while self.__writer is not None or self.__waiting:
+                self.__cond.wait()
+            self.__readers += 1
+
+    def release_read(self):
+        with self.__cond:
+            if self.__writer == threading.get_ident():
+                self.__depth -= 1
+                return
+            self.__readers -= 1
+            if not self.__readers:
+                self.__cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self.__cond:
+            if self.__writer == me:
+                self.__depth += 1
+                return
+            self.__waiting += 1
+            while self.__writer is not None or self.__readers:
+                self.__cond.wait()
+            self.__waiting -= 1
+            self.__writer = me
+            self.__depth = 1
+
+    def release_write(self):
+        with self.__cond:
+            self.__depth -= 1
+            if not self.__depth:
+                self.__writer = None
+                self.__cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield self
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield self
+        finally:
+            self.release_write()
+
+
+class LockTable(object):
+    """
+    Per Inode Reader Writer Locks
+    Inodes are keyed by identity, the dict of an Inode is the same
+    object for its whole life in the tree, renames included
+    """
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.locks)
+
+    def get(self, inode: dict) -> RWLock:
+        with self.lock:
+            return self.locks.setdefault(id(inode), RWLock())
+
+    def read(self, inode: dict):
+        return self.get(inode).read()
+
+    def write(self, inode: dict):
+        return self.get(inode).write()
+
+    def drop(self, inode: dict):
+        '''
+        Forget the lock of an Inode leaving the tree
+        '''
+        with self.lock:
+            self.locks.pop(id(inode), None)
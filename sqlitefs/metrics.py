@@ -0,0 +1,317 @@
+'''
+SQLiteFS Metrics
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import errno
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import count
+from time import perf_counter
+import fuse
+from .profiler import Profiler
+
+
+# Latency bucket upper bounds in seconds, 1us doubling up to ~16s
+BOUNDS = tuple(1E-6 * (1 << x) for x in range(25))
+
+STATS_FILE = '/.sqlitefs-stats'
+PROMETHEUS_FILE = '/.sqlitefs-stats.prom'
+
+# Operations served for the virtual stats files, the rest are refused
+STATS_OPS = ('getattr', 'access', 'open', 'read', 'release', 'flush',
+             'fsync', 'getxattr', 'listxattr')
+
+
+class Histogram(object):
+    """
+    Log2 Latency Histogram
+    Counts, total seconds and bytes of one operation or phase
+    """
+    def __init__(self):
+        self.buckets = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+
+    def observe(self, seconds: float, size: int = 0, error: bool = False):
+        self.buckets[bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.bytes += size
+        if error:
+            self.errors += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        '''
+        Upper bound of the bucket holding the q-th observation
+        '''
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, hits in zip(BOUNDS, self.buckets):
+            seen += hits
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def copy(self) -> 'Histogram':
+        other = Histogram()
+        other.__dict__.update(self.__dict__)
+        other.buckets = list(self.buckets)
+        return other
+
+
+class Metrics(object):
+    """
+    Operation and Phase Metrics
+    Operations are the FUSE calls, phases split their time into
+    crypto, serialization and sqlite. Components report gauges
+    through sources, callables returning a dict of numbers.
+    """
+    def __init__(self):
+        self.ops = {}
+        self.phases = {}
+        self.sources = {}
+        self.lock = threading.Lock()
+
+    def observe(self, op: str, seconds: float, size: int = 0,
+                error: bool = False):
+        with self.lock:
+            try:
+                histogram = self.ops[op]
+            except KeyError:
+                histogram = self.ops[op] = Histogram()
+            histogram.observe(seconds, size, error)
+
+    @contextmanager
+    def phase(self, name: str, size: int = 0):
+        '''
+        Time a block of work under a phase
+        '''
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            with self.lock:
+                try:
+                    histogram = self.phases[name]
+                except KeyError:
+                    histogram = self.phases[name] = Histogram()
+                histogram.observe(seconds, size)
+
+    def register(self, name: str, source):
+        self.sources[name] = source
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            ops = {x: y.copy() for x, y in self.ops.items()}
+            phases = {x: y.copy() for x, y in self.phases.items()}
+        gauges = {}
+        for name, source in self.sources.items():
+            gauges[name] = {
+                x: y for x, y in source().items()
+                if isinstance(y, (int, float))
+            }
+        return {'ops': ops, 'phases': phases, 'gauges': gauges}
+
+    def text(self) -> str:
+        '''
+        Human readable report
+        '''
+        snap = self.snapshot()
+        lines = []
+        for title, table in (('OPERATION', snap['ops']),
+                             ('PHASE', snap['phases'])):
+            lines.append(f'{title:<14}{"CALLS":>10}{"ERRORS":>8}'
+                         + f'{"BYTES":>14}{"MEAN ms":>10}{"P50 ms":>10}'
+                         + f'{"P99 ms":>10}{"MAX ms":>10}')
+            for name in sorted(table):
+                item = table[name]
+                mean = item.total / item.count if item.count else 0.0
+                lines.append(f'{name:<14}{item.count:>10}{item.errors:>8}'
+                             + f'{item.bytes:>14}{mean * 1E3:>10.3f}'
+                             + f'{item.quantile(0.5) * 1E3:>10.3f}'
+                             + f'{item.quantile(0.99) * 1E3:>10.3f}'
+                             + f'{item.max * 1E3:>10.3f}')
+            lines.append('')
+        for name in sorted(snap['gauges']):
+            lines.append(f'[{name}]')
+            for key, value in snap['gauges'][name].items():
+                lines.append(f'{key:<24}{value:>14.6g}')
+            lines.append('')
+        return '\n'.join(lines)
+
+    def prometheus(self) -> str:
+        '''
+        Prometheus text exposition format
+        '''
+        snap = self.snapshot()
+        lines = []
+        for metric, label, table, help_text in (
+                ('sqlitefs_op', 'op', snap['ops'], 'FUSE operation'),
+                ('sqlitefs_phase', 'phase', snap['phases'],
+                 'Operation phase')):
+            lines.append(f'# HELP {metric}_seconds {help_text} latency')
+            lines.append(f'# TYPE {metric}_seconds histogram')
+            for name in sorted(table):
+                item, seen = table[name], 0
+                for bound, hits in zip(BOUNDS, item.buckets):
+                    seen += hits
+                    lines.append(f'{metric}_seconds_bucket'
+                                 + f'{{{label}="{name}",le="{bound:.6g}"}} '
+                                 + f'{seen}')
+                lines.append(f'{metric}_seconds_bucket'
+                             + f'{{{label}="{name}",le="+Inf"}} '
+                             + f'{item.count}')
+                lines.append(f'{metric}_seconds_sum{{{label}="{name}"}} '
+                             + f'{item.total:.9g}')
+                lines.append(f'{metric}_seconds_count{{{label}="{name}"}} '
+                             + f'{item.count}')
+            for suffix, field in (('bytes_total', 'bytes'),
+                                  ('errors_total', 'errors')):
+                lines.append(f'# HELP {metric}_{suffix} {help_text} '
+                             + field)
+                lines.append(f'# TYPE {metric}_{suffix} counter')
+                for name in sorted(table):
+                    lines.append(f'{metric}_{suffix}{{{label}="{name}"}} '
+                                 + f'{getattr(table[name], field)}')
+        for name in sorted(snap['gauges']):
+            for key, value in snap['gauges'][name].items():
+                metric = f'sqlitefs_{name}_{key}'
+                lines.append(f'# TYPE {metric} gauge')
+                lines.append(f'{metric} {value:.9g}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsMixIn(object):
+    """
+    Times every FUSE call into self.metrics and serves the read-only
+    virtual stats files, replaces fuse.LoggingMixIn which logs every
+    call as text. Calls are still logged when the logger is at DEBUG,
+    and reported to the Profiler while slow tracing is on.
+    """
+    log = logging.getLogger('sqlitefs.metrics')
+
+    def init_metrics(self, name: str):
+        self.metrics = Metrics()
+        self.profiler = Profiler(name)
+        self.stats_views = {}
+        self.stats_current = {}
+        self.stats_fhs = count(1 << 32)
+
+    def __call__(self, op, path, *args):
+        if path in (STATS_FILE, PROMETHEUS_FILE) or (
+                op == 'rename' and args[0] in (STATS_FILE, PROMETHEUS_FILE)):
+            return self.stats_call(op, path, *args)
+        debug = self.log.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.log.debug('-> %s %s %s', op, path, repr(args))
+        ret, error = '[Unhandled Exception]', False
+        slow = self.profiler.slow
+        if slow:
+            self.profiler.enter(op, path)
+        start = perf_counter()
+        try:
+            ret = getattr(self, op)(path, *args)
+            return ret
+        except BaseException as e:
+            ret, error = f'{type(e).__name__}: {e}', True
+            raise
+        finally:
+            if error:
+                size = 0
+            elif op == 'read' and isinstance(ret, bytes):
+                size = len(ret)
+            elif op == 'write' and isinstance(ret, int):
+                size = ret
+            else:
+                size = 0
+            seconds = perf_counter() - start
+            self.metrics.observe(op, seconds, size, error)
+            if slow:
+                self.profiler.leave(seconds)
+            if debug:
+                self.log.debug('<- %s %s', op, repr(ret))
+
+    def stats_call(self, op, path, *args):
+        '''
+        FUSE call on a virtual stats file
+        A getattr renders the report and keeps it as the current view,
+        an open serves that same view so its length matches the size
+        the kernel was given, an open handle keeps its view to release
+        '''
+        if op not in STATS_OPS:
+            raise fuse.FuseOSError(errno.EACCES)
+        if op == 'getattr':
+            fh = args[0] if args else None
+            view = self.stats_views.get(fh)
+            if view is None:
+                view = self.stats_current[path] = self.stats_render(path)
+            return {
+                'st_mode': 0o100444,
+                'st_ino': 0,
+                'st_uid': self.uid,
+                'st_gid': self.gid,
+                'st_nlink': 1,
+                'st_size': len(view),
+                'st_ctime': 0,
+                'st_atime': 0,
+                'st_mtime': 0
+            }
+        if op == 'open':
+            fh = next(self.stats_fhs)
+            view = self.stats_current.get(path)
+            if view is None:
+                view = self.stats_current[path] = self.stats_render(path)
+            self.stats_views[fh] = view
+            return fh
+        if op == 'read':
+            size, offset, fh = args
+            view = self.stats_views.get(fh)
+            if view is None:
+                view = self.stats_current.get(path, b'')
+            return view[offset:offset + size]
+        if op == 'release':
+            self.stats_views.pop(args[0], None)
+            return 0
+        if op in ('getxattr', 'listxattr'):
+            return b'' if op == 'getxattr' else []
+        if op == 'access' and args[0] & 2:
+            raise fuse.FuseOSError(errno.EACCES)
+        return 0
+
+    def stats_render(self, path) -> bytes:
+        if path == PROMETHEUS_FILE:
+            return self.metrics.prometheus().encode()
+        return self.metrics.text().encode()
@@ -0,0 +1,297 @@
+'''
+SQLiteFS Profiler
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import os
+import sys
+import json
+import signal
+import threading
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+from time import perf_counter, sleep
+
+
+PROFILE_SIGNAL = signal.SIGUSR2
+
+
+def profile_dir() -> str:
+    '''
+    ~/.sqlitefs, where the CLI keeps volumes, configs and pid files
+    '''
+    return os.path.join(os.path.expanduser('~'), '.sqlitefs')
+
+
+def fold(frame) -> str:
+    '''
+    Collapsed stack of a frame, root first, for flame graphs
+    '''
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class Profiler(object):
+    """
+    On-demand Daemon Profiler
+    A sampling CPU profiler, tracemalloc snapshots and slow operation
+    tracing that can be switched on and off on a mounted volume.
+    Commands arrive through a control file and PROFILE_SIGNAL, a bare
+    signal toggles the CPU profiler. Dumps are written as
+    <name>-profile-<stamp>.* in the directory.
+    Parameters:-
+        name: str - Volume name used for the control and dump files
+        directory: str - Control and dump files, ~/.sqlitefs if None
+    """
+    def __init__(self, name: str, directory: str = None):
+        self.name = name
+        self.directory = directory or profile_dir()
+        self.interval = 0.005
+        self.threshold = 0.1
+        self.cpu = False
+        self.slow = False
+        self.cpu_stacks = Counter()
+        self.cpu_samples = 0
+        self.slow_ops = deque(maxlen=1024)
+        self.active = {}
+        self.dumps = []
+        self.lock = threading.Lock()
+        self.__sampler = None
+        self.__listener = None
+
+    @property
+    def control_file(self) -> str:
+        return os.path.join(self.directory, f'{self.name}-profile.ctl')
+
+    @property
+    def status_file(self) -> str:
+        return os.path.join(self.directory, f'{self.name}-profile.status')
+
+    def dump_file(self, kind: str) -> str:
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        return os.path.join(self.directory,
+                            f'{self.name}-profile-{stamp}.{kind}')
+
+    def listen(self):
+        '''
+        Serve PROFILE_SIGNAL on a thread of its own, call on the main
+        thread before the FUSE loop so every thread inherits the mask
+        '''
+        if self.__listener is not None:
+            return
+        signal.pthread_sigmask(signal.SIG_BLOCK, {PROFILE_SIGNAL})
+        self.__listener = threading.Thread(target=self.wait, daemon=True,
+                                           name='profile-control')
+        self.__listener.start()
+
+    def wait(self):
+        while True:
+            signal.sigwait({PROFILE_SIGNAL})
+            self.control()
+
+    def control(self):
+        '''
+        Apply the pending control file command, or toggle the
+        CPU profiler when there is none. The control file is removed
+        once the status is written.
+        '''
+        try:
+            with open(self.control_file) as file:
+                command = json.load(file)
+        except FileNotFoundError:
+            command = {'kind': 'cpu', 'action': 'off' if self.cpu else 'on'}
+        except ValueError:
+            command = None
+        try:
+            if command is None:
+                raise ValueError('Malformed control file')
+            self.command(**command)
+        except Exception as e:
+            self.write_status(error=f'{type(e).__name__}: {e}')
+        finally:
+            if os.path.exists(self.control_file):
+                os.remove(self.control_file)
+
+    def command(self, kind: str, action: str = None,
+                threshold: float = None, interval: float = None):
+        '''
+        Run one profiler command
+        Args:
+            kind: str - 'cpu', 'memory', 'slow' or 'status'
+            action: str - 'on', 'off' or 'dump'
+            threshold: float - Slow operation threshold in seconds
+            interval: float - Sampling interval in seconds
+
+        Returns:
+            list - Files dumped by the command
+        '''
+        if threshold is not None:
+            self.threshold = threshold
+        if interval is not None:
+            self.interval = interval
+        dumps = []
+        if kind == 'cpu':
+            if action == 'on':
+                with self.lock:
+                    self.cpu_stacks, self.cpu_samples = Counter(), 0
+                self.cpu = True
+            elif action in ('off', 'dump'):
+                self.cpu = action != 'off' and self.cpu
+                dumps.append(self.dump_cpu())
+        elif kind == 'memory':
+            if action == 'on':
+                tracemalloc.start(25)
+            elif action in ('off', 'dump') and tracemalloc.is_tracing():
+                dumps.extend(self.dump_memory())
+                if action == 'off':
+                    tracemalloc.stop()
+        elif kind == 'slow':
+            if action == 'on':
+                with self.lock:
+                    self.slow_ops.clear()
+                self.slow = True
+            elif action in ('off', 'dump'):
+                self.slow = action != 'off' and self.slow
+                dumps.append(self.dump_slow())
+        elif kind != 'status':
+            raise ValueError(f'Unknown profiler \'{kind}\'')
+        if self.cpu or self.slow:
+            self.start_sampler()
+        self.dumps.extend(dumps)
+        self.write_status()
+        return dumps
+
+    def status(self) -> dict:
+        return {
+            'cpu': self.cpu,
+            'cpu_samples': self.cpu_samples,
+            'memory': tracemalloc.is_tracing(),
+            'slow': self.slow,
+            'slow_ops': len(self.slow_ops),
+            'threshold': self.threshold,
+            'interval': self.interval,
+            'dumps': self.dumps[-16:]
+        }
+
+    def write_status(self, **extra):
+        with open(self.status_file, 'w') as file:
+            json.dump({**self.status(), **extra}, file, indent=2)
+
+    def start_sampler(self):
+        if self.__sampler is not None and self.__sampler.is_alive():
+            return
+        self.__sampler = threading.Thread(target=self.sample, daemon=True,
+                                          name='profile-sampler')
+        self.__sampler.start()
+
+    def sample(self):
+        '''
+        Sampler thread, runs while the CPU profiler or slow
+        operation tracing is on
+        '''
+        skip = {threading.get_ident()}
+        if self.__listener is not None:
+            skip.add(self.__listener.ident)
+        while self.cpu or self.slow:
+            sleep(self.interval)
+            frames = sys._current_frames()
+            now = perf_counter()
+            with self.lock:
+                if self.cpu:
+                    self.cpu_samples += 1
+                    for ident, frame in frames.items():
+                        if ident not in skip:
+                            self.cpu_stacks[fold(frame)] += 1
+                if self.slow:
+                    for ident, entry in list(self.active.items()):
+                        if now - entry[2] >= self.threshold and\
+                                ident in frames:
+                            entry[3][fold(frames[ident])] += 1
+            del frames
+
+    def enter(self, op: str, path: str):
+        '''
+        Mark the calling thread as inside a FUSE operation
+        '''
+        self.active[threading.get_ident()] = [op, path, perf_counter(),
+                                              Counter()]
+
+    def leave(self, seconds: float):
+        '''
+        Close the operation of the calling thread,
+        keep it if it ran over the threshold
+        '''
+        entry = self.active.pop(threading.get_ident(), None)
+        if entry is None or seconds < self.threshold:
+            return
+        with self.lock:
+            self.slow_ops.append((datetime.now().isoformat(), entry[0],
+                                  entry[1], seconds, entry[3]))
+
+    def dump_cpu(self) -> str:
+        '''
+        Collapsed stacks, one 'stack count' line each
+        '''
+        path = self.dump_file('cpu.folded')
+        with self.lock:
+            stacks = self.cpu_stacks.most_common()
+        with open(path, 'w') as file:
+            for stack, hits in stacks:
+                file.write(f'{stack} {hits}\n')
+        return path
+
+    def dump_memory(self) -> list:
+        '''
+        tracemalloc snapshot and its top allocation sites
+        '''
+        path = self.dump_file('tracemalloc')
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(path)
+        with open(path + '.txt', 'w') as file:
+            current, peak = tracemalloc.get_traced_memory()
+            file.write(f'current {current} peak {peak}\n')
+            for stat in snapshot.statistics('lineno')[:50]:
+                file.write(f'{stat}\n')
+        return [path, path + '.txt']
+
+    def dump_slow(self) -> str:
+        '''
+        Operations over the threshold with their sampled stacks
+        '''
+        path = self.dump_file('slow.log')
+        with self.lock:
+            slow_ops = list(self.slow_ops)
+        with open(path, 'w') as file:
+            for stamp, op, op_path, seconds, stacks in slow_ops:
+                file.write(f'{stamp} {op} {op_path} {seconds * 1E3:.3f}ms\n')
+                for stack, hits in stacks.most_common():
+                    file.write(f'    {hits:>6} {stack}\n')
+        return path
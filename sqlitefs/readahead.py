@@ -0,0 +1,149 @@
+'''
+SQLiteFS Read-ahead
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import threading
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor, wait
+from .blockstore import block_span
+
+
+class Stream(object):
+    """
+    Read Pattern of one File Handle
+    """
+    def __init__(self, window: int):
+        self.offset = None
+        self.window = window
+        self.ahead = 0
+
+
+class ReadAhead(object):
+    """
+    Sequential Read-ahead
+    Detects sequential reads per file handle and fetches the next
+    window of blocks in background threads, the window doubles while
+    reads stay sequential and falls back on a random read
+    Parameters:-
+        fetch: callable - fetch(inode, block) decodes a block into the cache
+        workers: int - Background fetch threads
+        window: int - Initial window in blocks
+        max_window: int - Largest window in blocks
+    """
+    def __init__(self, fetch, workers: int = 4, window: int = 4,
+                 max_window: int = 64):
+        self.fetch = fetch
+        self.workers = workers
+        self.window = window
+        self.max_window = max_window
+        self.streams = {}
+        self.inflight = {}
+        self.prefetched = 0
+        self.lock = threading.RLock()
+        self.__handles = count(1)
+        self.__executor = None
+
+    def executor(self) -> ThreadPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix='readahead')
+        return self.__executor
+
+    def open(self) -> int:
+        '''
+        New File Handle
+        '''
+        with self.lock:
+            fh = next(self.__handles)
+            self.streams[fh] = Stream(self.window)
+        return fh
+
+    def close(self, fh: int):
+        with self.lock:
+            self.streams.pop(fh, None)
+
+    def access(self, fh: int, inode: dict, offset: int, size: int,
+               blocks: int):
+        '''
+        Record a read and schedule the window after it
+        Args:
+            fh: int - File Handle
+            inode: dict - File Inode
+            offset: int - Read offset in bytes
+            size: int - Read size in bytes
+            blocks: int - Blocks in the file
+        '''
+        span = block_span(offset, size)
+        with self.lock:
+            stream = self.streams.get(fh)
+            if stream is None or self.workers <= 0:
+                return
+            sequential = stream.offset == offset or\
+                (stream.offset is None and offset == 0)
+            stream.offset = offset + size
+            if sequential:
+                stream.window = min(stream.window * 2, self.max_window)
+            else:
+                stream.window = self.window
+                stream.ahead = span.stop
+                return
+            end = min(span.stop + stream.window, blocks)
+            todo = [x for x in range(max(stream.ahead, span.stop), end)
+                    if (inode[0x7E], x) not in self.inflight]
+            stream.ahead = max(stream.ahead, end)
+            for block in todo:
+                future = self.executor().submit(self.fetch, inode, block)
+                self.inflight[(inode[0x7E], block)] = future
+                future.add_done_callback(
+                    lambda _, key=(inode[0x7E], block): self.done(key))
+            self.prefetched += len(todo)
+
+    def done(self, key: tuple):
+        with self.lock:
+            self.inflight.pop(key, None)
+
+    def wait(self, file_id: int, span: range):
+        '''
+        Wait for running fetches of the blocks about to be read
+        '''
+        with self.lock:
+            futures = [self.inflight[(file_id, x)] for x in span
+                       if (file_id, x) in self.inflight]
+        if futures:
+            wait(futures)
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+
+    def stats(self) -> dict:
+        return {
+            'streams': len(self.streams),
+            'inflight': len(self.inflight),
+            'prefetched': self.prefetched
+        }
@@ -30,11 +30,12 @@ from litefs import (
     fuse,
     logging,
     SecFS,
-    SqliteDict,
+    Storage,
+    storage_options,
 )
 import os
 import npyscreen
-from coreutils import load_fs
+from coreutils import load_fs, walker
 from configparser import ConfigParser
 import curses
 from daemonocle import Daemon
@@ -150,14 +151,14 @@ class Props_Box(npyscreen.BoxTitle):
     def load_fstat(self, *args, **kwds):
         value = volumes[kwds['value']]
         self.volume = config[value]['VOLUME_NAME']
-        self.db = SqliteDict(os.path.abspath(f"./{value}.db"), autocommit=False, tablename=self.volume)
+        self.db = Storage(os.path.abspath(f"./{value}.db"), self.volume, **storage_options(config[value]))
         self.dopex = DOPE2.marshall(self.db['auth_key'], b'test')
         self.dopex.fixate()
         self.fs = load_fs(self.dopex.decode(self.db[self.volume]))
         self.fstat = self.fs[0xF8]
         self.values = [f'Volume Name : {self.volume}',
                        f'Block Size : {self.fstat["f_bsize"]}',
-                       f'Files Stored : {len(self.db) - 2}',
+                       f'Files Stored : {len([x for x in walker(self.fs) if 0x7F in x[1]])}',
                        f'Size of Storage : {self.fstat["f_blocks"]*512/1E9:.4f} GB',
                        f'Storage Used : {(self.fstat["f_blocks"] - self.fstat["f_bfree"])*512/1E9:.4f} GB',
                        f'On-Disk : {getattr(os.stat(f"./{value}.db"), "st_size")/1E9:.4f} GB']
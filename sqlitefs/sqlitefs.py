@@ -31,16 +31,20 @@ from .litefs import (
     fuse,
     logging,
     SecFS,
-    SqliteDict,
+    Storage,
+    storage_options,
+    STORAGE_DEFAULTS,
     init_fs,
     load_fs,
     dump_fs
 )
 from .dope import DOPE2
+from .tuner import make_dope
 import click
 import sys
 import os
 from functools import partial
+from time import time
 from daemonocle import Daemon
 
 
@@ -61,8 +65,30 @@ def cli():
 @click.option('-q', '--quota', help='Data Quota for the Volume in MB',
               type=float, default=1E3, prompt='Volume Size Quota(MB)',
               show_default=True)
+@click.option('-p', '--profile', default='default', show_default=True,
+              help='DOPE Profile, a preset or BLOCK:POLY:T:MODE from tune')
+@click.option('--dedup', type=bool, default=False, is_flag=True,
+              help='Store identical blocks once')
+@click.option('-z', '--compression', default='none', show_default=True,
+              type=click.Choice(['none', 'zlib', 'lz4', 'zstd', 'auto']),
+              help='Compress blocks before encryption')
 @click.password_option()
-def init(name, mount, volume_name, debug, quota, password):
+def init(name, mount, volume_name, debug, quota, profile, dedup,
+         compression, password):
+    from .dope import compression_codec
+    try:
+        compression = compression_codec(compression) or 'none'
+    except TypeError as e:
+        raise click.BadParameter(str(e), param_hint='--compression')
+    try:
+        dopex = make_dope(password.encode(), profile)
+    except (ValueError, RuntimeError) as e:
+        raise click.BadParameter(str(e), param_hint='--profile')
+    if os.path.exists(os.path.join(
+                os.environ['HOME'],
+                '.sqlitefs',
+                f'{name}.db')):
+        raise click.ClickException(f'{name} already exists')
     from configparser import ConfigParser
     config = ConfigParser()
     config.read(os.path.abspath(f'~/.sqlitefs/config.ini'))
@@ -70,24 +96,20 @@ def init(name, mount, volume_name, debug, quota, password):
         'VOLUME_NAME': volume_name,
         'MOUNT': os.path.abspath(mount),
         'DEBUG': debug,
-        'SIZE': quota
+        'SIZE': quota,
+        'DEDUP': dedup,
+        'COMPRESSION': compression,
+        **STORAGE_DEFAULTS
     }
     with open(os.path.abspath(f'~/.sqlitefs/config.ini'), 'w') as file:
         config.write(file)
     if not os.path.exists(os.path.abspath(mount)):
         os.mkdir(os.path.abspath(mount))
     quota = int(quota * 1E6)
-    if os.path.exists(os.path.join(
+    fs = Storage(os.path.join(
                 os.environ['HOME'],
                 '.sqlitefs',
-                f'{name}.db')):
-        raise click.ClickException(f'{name} already exists')
-    fs = SqliteDict(os.path.join(
-                os.environ['HOME'],
-                '.sqlitefs',
-                f'{name}.db'), autocommit=True, tablename=volume_name)
-    dopex = DOPE2(password.encode(), 8219, 32, 'GCM', b'',
-                  block_size=512)
+                f'{name}.db'), volume_name, **storage_options(config[name]))
     fs['auth_key'] = dopex.serialize()
     dopex.fixate()
     fs[volume_name] = dopex.encode(init_fs(volume_name, fs_size=quota))
@@ -113,11 +135,11 @@ def config(name, mount, volume_name, debug, quota, password):
     config = ConfigParser()
     config.read(os.path.abspath(f'~/.sqlitefs/config.ini'))
     quota = int(quota * 1E6)
-    fs = SqliteDict(os.path.join(
+    fs = Storage(os.path.join(
                 os.environ['HOME'],
                 '.sqlitefs',
-                f'{name}.db'), autocommit=True,
-                    tablename=config[name]['VOLUME_NAME'])
+                f'{name}.db'), config[name]['VOLUME_NAME'],
+                 **storage_options(config[name]))
     try:
         dopex = DOPE2.marshall(fs['auth_key'], password.encode())
         dopex.fixate()
@@ -147,36 +169,212 @@ def config(name, mount, volume_name, debug, quota, password):
             del fs[config[name]['VOLUME_NAME']]
         else:
             fs[volume_name] = dopex.encode(dump_fs(DIR))
+        fs.commit()
     except Exception as e:
         click.secho('ACCESS DENIED', fg='red')
         raise click.ClickException(e)
+    finally:
+        fs.close()
     config[name] = {
+        **storage_options(config[name]),
         'VOLUME_NAME': volume_name,
         'MOUNT': mount,
         'DEBUG': debug,
-        'SIZE': quota * 1E-6
+        'SIZE': quota * 1E-6,
+        'DEDUP': config[name].get('DEDUP', False),
+        'COMPRESSION': config[name].get('COMPRESSION', 'none')
     }
     with open(os.path.abspath(f'~/.sqlitefs/config.ini'), 'w') as file:
         config.write(file)
 
 
+@cli.command(short_help='Convert a Volume',
+             help='Re-encode DOPE 2.0 pickled containers in the binary format')
+@click.argument('name', type=str)
+@click.password_option()
+def convert(name, password):
+    from configparser import ConfigParser
+    config = ConfigParser()
+    config.read(os.path.abspath(f'~/.sqlitefs/config.ini'))
+    fs = Storage(os.path.join(
+                os.environ['HOME'],
+                '.sqlitefs',
+                f'{name}.db'), config[name]['VOLUME_NAME'],
+                 **storage_options(config[name]))
+    converted = 0
+    try:
+        dopex = DOPE2.marshall(fs['auth_key'], password.encode())
+        with click.progressbar(list(fs.keys()),
+                               label='Converting') as keys:
+            for key in keys:
+                value = fs[key]
+                if key == 'auth_key' or not isinstance(value, bytes):
+                    continue
+                dopex.fixate()
+                data = dopex.convert(value)
+                if data is not value:
+                    fs[key] = data
+                    converted += 1
+        fs.commit()
+    except Exception as e:
+        click.secho('ACCESS DENIED', fg='red')
+        raise click.ClickException(e)
+    finally:
+        fs.close()
+    click.echo(f'{converted} containers converted')
+
+
+@cli.command('import', short_help='Import a Directory',
+             help='Bulk copy a host directory into a stopped Volume')
+@click.argument('name', type=str)
+@click.argument('source', type=click.Path(exists=True, file_okay=False))
+@click.option('-t', '--target', default='/', show_default=True,
+              help='Volume directory to import into')
+@click.option('-w', '--workers', type=int, default=os.cpu_count(),
+              show_default=True, help='Encryption workers')
+@click.option('-b', '--batch', type=float, default=64, show_default=True,
+              help='MB stored per transaction')
+@click.password_option()
+def ingest(name, source, target, workers, batch, password):
+    from configparser import ConfigParser
+    from .importer import Importer, source_size
+    config = ConfigParser()
+    config.read(os.path.abspath(f'~/.sqlitefs/config.ini'))
+    try:
+        config = config[name]
+    except KeyError:
+        raise click.ClickException(f'No Filesystem named \'{name}\'')
+    try:
+        with open(os.path.realpath(f'~/.sqlitefs/{name}.pid')) as file:
+            os.kill(int(file.read()), 0)
+        raise click.ClickException(f'{name} is mounted, stop the server first')
+    except (OSError, ValueError):
+        pass
+    source = os.path.abspath(source)
+    total = source_size(source)
+    os.chdir(os.environ['HOME'])
+    try:
+        fs = open_volume(name, config, password.encode())
+    except Exception as e:
+        click.secho('ACCESS DENIED', fg='red')
+        raise click.ClickException(e)
+    importer = Importer(fs, password.encode(),
+                        config.get('COMPRESSION', 'none'), workers,
+                        batch=int(batch * 1E6))
+    start = time()
+
+    def rate(item):
+        return f'{item / max(time() - start, 1E-6) / 1E6:.2f} MB/s'\
+            if item is not None else ''
+
+    done = 0
+    try:
+        with click.progressbar(length=total, label='Importing',
+                               item_show_func=rate) as bar:
+            def progress(size):
+                nonlocal done
+                done += size
+                bar.update(size, done)
+            result = importer.run(source, target, progress)
+    except BaseException as e:
+        fs.db.close()
+        if isinstance(e, OSError):
+            raise click.ClickException(e)
+        raise
+    fs.destroy()
+    click.echo(f"{result['files']} files, {result['directories']} "
+               + f"directories, {result['bytes'] / 1E6:.2f} MB in "
+               + f"{result['seconds']:.2f}s ({result['mbps']:.2f} MB/s)")
+    if result['skipped']:
+        click.secho(f"{result['skipped']} entries skipped", fg='yellow')
+
+
+@cli.command(short_help='Run Benchmarks',
+             help='Mount-free SecFS and DOPE benchmarks')
+@click.option('-o', '--output', type=click.Path(),
+              help='Write results to a JSON file')
+@click.option('-c', '--compare', 'baseline', type=click.Path(exists=True),
+              help='Flag regressions against a saved JSON baseline')
+@click.option('-t', '--threshold', type=float, default=0.1,
+              show_default=True, help='Relative change counted as regression')
+@click.option('--quick', type=bool, default=False, is_flag=True,
+              help='Smaller workloads')
+def bench(output, baseline, threshold, quick):
+    import json
+    from .bench import run_suite, compare
+    result = run_suite(quick=quick)
+    if output:
+        with open(output, 'w') as file:
+            json.dump(result, file, indent=2)
+    else:
+        click.echo(json.dumps(result, indent=2))
+    if baseline:
+        with open(baseline) as file:
+            regressions = compare(result, json.load(file), threshold)
+        for item in regressions:
+            click.secho(f"REGRESSION {item['metric']}: "
+                        + f"{item['baseline']:.6g} -> {item['current']:.6g}"
+                        + f" ({item['change']:+.1%})", fg='red')
+        if regressions:
+            sys.exit(1)
+        click.secho('No regressions', fg='green')
+
+
+@cli.command(short_help='Tune DOPE Parameters',
+             help='Benchmark DOPE block size, BCH code and AES mode')
+@click.option('-s', '--size', type=int, default=1 << 18, show_default=True,
+              help='Bytes encoded per combination')
+@click.option('--json', 'as_json', type=bool, default=False, is_flag=True,
+              help='Print results as JSON')
+def tune(size, as_json):
+    import json
+    from .tuner import tune as run_tuner
+    result = run_tuner(size=size)
+    if as_json:
+        click.echo(json.dumps(result, indent=2))
+        return
+    click.echo(f"{'PROFILE':<20}{'ENC MB/s':>10}{'DEC MB/s':>10}"
+               + f"{'CPU s/MB':>10}{'EXPANSION':>11}")
+    for item in result['results']:
+        if 'error' in item:
+            click.secho(f"{item['profile']:<20}  {item['error']}",
+                        fg='yellow')
+            continue
+        click.echo(f"{item['profile']:<20}{item['encode_mbps']:>10.2f}"
+                   + f"{item['decode_mbps']:>10.2f}"
+                   + f"{item['cpu_s_per_mb']:>10.3f}"
+                   + f"{item['expansion']:>11.4f}")
+    if result['recommended']:
+        click.secho(f"Recommended : sqlitefs init --profile "
+                    + f"{result['recommended']} NAME", fg='green')
+
+
+def open_volume(name, config, password: bytes) -> SecFS:
+    '''
+    SecFS of a configured Volume, opened the way the File Server opens it
+    '''
+    return SecFS(name, password, config['VOLUME_NAME'],
+                 size=int(float(config['SIZE'])*1E6),
+                 storage=storage_options(config),
+                 dedup=config.getboolean('DEDUP', False),
+                 compression=config.get('COMPRESSION', 'none'))
+
+
 def runtime_fusing(ctx):
     '''
     Runtime FUSE Server Integration Programme
     '''
-    volume_name = ctx['CONFIG']['VOLUME_NAME']
     mount = ctx['CONFIG']['MOUNT']
     debug = ctx['CONFIG']['DEBUG']
-    size = int(float(ctx['CONFIG']['SIZE'])*1E6)
     name = ctx['NAME']
     if not os.path.exists(mount):
         os.system(f'sudo mkdir {os.path.abspath(mount)} && '
                   + f'chown {os.getuid()}:{os.getgid()} '
                   + f'{os.path.abspath(mount)}')
-    secfs = fuse.FUSE(SecFS(name, ctx['PASS'],
-                            volume_name, size=size),
-                      mountpoint=mount, foreground=True, fsname=name,
-                      subtype='fuseblk')
+    operations = open_volume(name, ctx['CONFIG'], ctx['PASS'])
+    operations.profiler.listen()
+    secfs = fuse.FUSE(operations, mountpoint=mount, foreground=True,
+                      fsname=name, subtype='fuseblk')
 
 
 @cli.group(short_help='Server Handler', help='SQLiteFS Server')
@@ -259,6 +457,69 @@ def status(ctx, json):
         raise click.ClickException(e)
 
 
+@server.command(short_help='File Server Statistics')
+@click.option('-p', '--prometheus', type=bool, default=False, is_flag=True,
+              help='Prometheus text format')
+@click.pass_context
+def stats(ctx, prometheus):
+    from .metrics import STATS_FILE, PROMETHEUS_FILE
+    stats_file = PROMETHEUS_FILE if prometheus else STATS_FILE
+    try:
+        with open(os.path.abspath(ctx.obj['CONFIG']['MOUNT'])
+                  + stats_file) as file:
+            click.echo(file.read(), nl=False)
+    except OSError:
+        click.secho('FAILED', bg='bright_red')
+        raise click.ClickException(
+            f"{ctx.obj['NAME']} is not mounted at "
+            + f"{ctx.obj['CONFIG']['MOUNT']}")
+
+
+@server.command(short_help='Profile File Server',
+                help='Profile a running File Server, dumps are written to '
+                + '~/.sqlitefs/NAME-profile-*')
+@click.argument('kind', type=click.Choice(['cpu', 'memory', 'slow',
+                                           'status']))
+@click.argument('action', type=click.Choice(['on', 'off', 'dump']),
+                required=False)
+@click.option('-t', '--threshold', type=float, default=None,
+              help='Slow operation threshold in ms  [default: 100]')
+@click.option('-i', '--interval', type=float, default=None,
+              help='Sampling interval in ms  [default: 5]')
+@click.pass_context
+def profile(ctx, kind, action, threshold, interval):
+    import json
+    import time
+    from .profiler import Profiler, PROFILE_SIGNAL
+    if kind != 'status' and action is None:
+        raise click.BadParameter('on, off or dump', param_hint='ACTION')
+    profiler = Profiler(ctx.obj['NAME'])
+    try:
+        with open(os.path.realpath(
+                f"~/.sqlitefs/{ctx.obj['NAME']}.pid")) as file:
+            pid = int(file.read())
+        with open(profiler.control_file, 'w') as file:
+            json.dump({
+                'kind': kind,
+                'action': action,
+                'threshold': threshold * 1E-3 if threshold else None,
+                'interval': interval * 1E-3 if interval else None
+            }, file)
+        os.kill(pid, PROFILE_SIGNAL)
+    except (OSError, ValueError) as e:
+        click.secho('FAILED', bg='bright_red')
+        raise click.ClickException(e)
+    for _ in range(100):
+        if not os.path.exists(profiler.control_file):
+            break
+        time.sleep(0.1)
+    else:
+        os.remove(profiler.control_file)
+        raise click.ClickException('File Server did not answer')
+    with open(profiler.status_file) as file:
+        click.echo(file.read())
+
+
 def main():
     cli(obj={})
 
@@ -0,0 +1,314 @@
+'''
+SQLiteFS Storage Engine
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import sqlite3
+import threading
+import pickle
+from queue import Queue, Empty, Full
+
+
+KIND_BYTES = 0x00
+KIND_PICKLE = 0x01
+
+STORAGE_DEFAULTS = {
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'PAGE_SIZE': 8192,
+    'MMAP_SIZE': 1 << 28,
+    'CACHE_SIZE': -65536,
+    'READERS': 4
+}
+
+TOMBSTONE = object()
+
+# Keys per SELECT, under the 999 host parameters of older SQLite builds
+FETCH_CHUNK = 512
+
+# Legacy rows held at once by migrate, they can be whole file blobs
+MIGRATE_CHUNK = 64
+
+
+def storage_options(section) -> dict:
+    '''
+    Storage settings of a config.ini Volume section
+    Args:
+        section: SectionProxy - Volume Section, missing keys use defaults
+
+    Returns:
+        dict - Storage keyword arguments
+    '''
+    options = {}
+    for key, default in STORAGE_DEFAULTS.items():
+        value = section.get(key, default) if section is not None else default
+        options[key.lower()] = type(default)(value)
+    return options
+
+
+def pack(value) -> tuple:
+    if isinstance(value, bytes):
+        return value, KIND_BYTES
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), KIND_PICKLE
+
+
+def unpack(value: bytes, kind: int):
+    if kind == KIND_BYTES:
+        return bytes(value)
+    return pickle.loads(value)
+
+
+class Storage(object):
+    """
+    Native SQLite Key Value Store
+    One WAL mode database per Volume with a single writer connection
+    and a pool of reader connections. Writes are held in memory until
+    commit and applied with executemany in one transaction, readers
+    see them through the overlay. bytes are stored as-is, everything
+    else is pickled.
+    Parameters:-
+        filename: str - Database File
+        tablename: str - Volume Name
+        journal_mode: str - SQLite journal_mode
+        synchronous: str - SQLite synchronous
+        page_size: int - Page size of new databases
+        mmap_size: int - Bytes memory mapped per connection
+        cache_size: int - Page cache per connection, negative is KiB
+        readers: int - Reader connections
+    """
+    def __init__(self, filename: str, tablename: str,
+                 journal_mode: str = 'WAL', synchronous: str = 'NORMAL',
+                 page_size: int = 8192, mmap_size: int = 1 << 28,
+                 cache_size: int = -65536, readers: int = 4):
+        self.filename = filename
+        self.tablename = tablename
+        self.table = '"%s:kv"' % tablename.replace('"', '""')
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.page_size = page_size
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.overlay = {}
+        self.committing = {}
+        self.lock = threading.Lock()
+        self.commit_lock = threading.Lock()
+        self.writer = self.connect(create=True)
+        self.writer.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} '
+            '(key TEXT PRIMARY KEY, value BLOB, kind INTEGER)')
+        self.writer.commit()
+        self.migrate()
+        self.readers = Queue(maxsize=max(readers, 1))
+        for _ in range(max(readers, 1)):
+            self.readers.put(self.connect())
+
+    def connect(self, create: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.filename, check_same_thread=False,
+                               cached_statements=256)
+        if create:
+            conn.execute(f'PRAGMA page_size = {int(self.page_size)}')
+            conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        return conn
+
+    def migrate(self):
+        '''
+        Move rows of a SqliteDict Volume table into this store,
+        MIGRATE_CHUNK rows at a time in one transaction
+        '''
+        legacy = '"%s"' % self.tablename.replace('"', '""')
+        found = self.writer.execute(
+            'SELECT name FROM sqlite_master WHERE type = \'table\' '
+            'AND name = ?', (self.tablename,)).fetchone()
+        if found is None:
+            return
+        last = 0
+        while True:
+            rows = self.writer.execute(
+                f'SELECT rowid, key, value FROM {legacy} WHERE rowid > ? '
+                'ORDER BY rowid LIMIT ?', (last, MIGRATE_CHUNK)).fetchall()
+            if not rows:
+                break
+            self.writer.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, kind) '
+                'VALUES (?, ?, ?)',
+                ((key,) + pack(pickle.loads(bytes(value)))
+                 for _, key, value in rows))
+            last = rows[-1][0]
+        self.writer.execute(f'DROP TABLE {legacy}')
+        self.writer.commit()
+
+    def reader(self) -> sqlite3.Connection:
+        '''
+        Take a Reader from the Pool, open one if the Pool is dry
+        '''
+        try:
+            return self.readers.get_nowait()
+        except Empty:
+            return self.connect()
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            self.readers.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def fetch(self, keys: list) -> dict:
+        '''
+        Committed values of keys, absent keys are left out,
+        read FETCH_CHUNK keys per SELECT
+        '''
+        keys = list(dict.fromkeys(keys))
+        conn = self.reader()
+        try:
+            result = {}
+            for x in range(0, len(keys), FETCH_CHUNK):
+                chunk = keys[x:x + FETCH_CHUNK]
+                marks = ', '.join('?' * len(chunk))
+                for key, value, kind in conn.execute(
+                        f'SELECT key, value, kind FROM {self.table} '
+                        f'WHERE key IN ({marks})', chunk):
+                    result[key] = unpack(value, kind)
+            return result
+        finally:
+            self.release(conn)
+
+    def get_many(self, keys: list) -> dict:
+        '''
+        Values of keys, absent keys are left out
+        '''
+        result, missing = {}, []
+        with self.lock:
+            for key in keys:
+                for table in (self.overlay, self.committing):
+                    if key in table:
+                        if table[key] is not TOMBSTONE:
+                            result[key] = table[key]
+                        break
+                else:
+                    missing.append(key)
+        if missing:
+            result.update(self.fetch(missing))
+        return result
+
+    def put_many(self, items: dict):
+        with self.lock:
+            self.overlay.update(items)
+
+    def delete_many(self, keys: list):
+        with self.lock:
+            for key in keys:
+                self.overlay[key] = TOMBSTONE
+
+    def get(self, key: str, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def __getitem__(self, key: str):
+        result = self.get_many([key])
+        if key not in result:
+            raise KeyError(key)
+        return result[key]
+
+    def __setitem__(self, key: str, value):
+        with self.lock:
+            self.overlay[key] = value
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self.delete_many([key])
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.get_many([key])
+
+    def keys(self) -> list:
+        conn = self.reader()
+        try:
+            keys = dict.fromkeys(x for x, in conn.execute(
+                f'SELECT key FROM {self.table} ORDER BY rowid'))
+        finally:
+            self.release(conn)
+        with self.lock:
+            for table in (self.committing, self.overlay):
+                for key, value in table.items():
+                    if value is TOMBSTONE:
+                        keys.pop(key, None)
+                    else:
+                        keys[key] = None
+        return list(keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def commit(self):
+        '''
+        Apply pending writes in one transaction
+        '''
+        with self.commit_lock:
+            with self.lock:
+                self.committing, self.overlay = self.overlay, {}
+            batch = self.committing
+            try:
+                self.writer.executemany(
+                    f'INSERT OR REPLACE INTO {self.table} (key, value, kind) '
+                    'VALUES (?, ?, ?)',
+                    ((key,) + pack(value) for key, value in batch.items()
+                     if value is not TOMBSTONE))
+                self.writer.executemany(
+                    f'DELETE FROM {self.table} WHERE key = ?',
+                    ((key,) for key, value in batch.items()
+                     if value is TOMBSTONE))
+                self.writer.commit()
+            except Exception:
+                self.writer.rollback()
+                with self.lock:
+                    batch.update(self.overlay)
+                    self.overlay, self.committing = batch, {}
+                raise
+            with self.lock:
+                self.committing = {}
+
+    def close(self):
+        '''
+        Close every connection, pending writes are discarded
+        '''
+        with self.lock:
+            self.overlay = {}
+        while True:
+            try:
+                self.readers.get_nowait().close()
+            except Empty:
+                break
+        self.writer.close()
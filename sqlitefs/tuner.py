@@ -0,0 +1,193 @@
+'''
+SQLiteFS DOPE Parameter Tuner
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+from os import urandom
+from time import perf_counter, process_time
+from .dope import DOPE2, AES_MODE_LOOKUP
+
+# (block_size, bch_poly, ecc_size, aes_mode)
+PROFILES = {
+    'default': (512, 8219, 32, 'GCM'),
+    'balanced': (1024, 16427, 16, 'GCM'),
+    'throughput': (2048, 32771, 8, 'GCM')
+}
+
+# Primitive polynomials of GF(2^13), GF(2^14) and GF(2^15),
+# a BCH code over GF(2^m) covers at most 2^m - 1 bits per packet
+BCH_CODES = (
+    (8219, 8), (8219, 16), (8219, 32),
+    (16427, 8), (16427, 16), (16427, 32),
+    (32771, 8), (32771, 16), (32771, 32)
+)
+AEAD_MODES = ('GCM', 'SIV')
+
+
+def bch_fits(block_size: int, bch_poly: int, ecc_size: int) -> bool:
+    '''
+    Whether a BCH code over GF(2^m) covers a packet of the block size
+    '''
+    m = bch_poly.bit_length() - 1
+    return (block_size - 4) * 8 + m * ecc_size <= (1 << m) - 1
+
+
+def profile_name(block_size: int, bch_poly: int, ecc_size: int,
+                 aes_mode: str) -> str:
+    '''
+    Preset name of a parameter set, 'custom' if it has none
+    '''
+    for name, params in PROFILES.items():
+        if params == (block_size, bch_poly, ecc_size, aes_mode):
+            return name
+    return 'custom'
+
+
+def parse_profile(profile: str) -> tuple:
+    '''
+    Parameters of a preset name or a BLOCK:POLY:T:MODE spec
+    Args:
+        profile: str - e.g. 'balanced' or '1024:16427:16:GCM'
+
+    Returns:
+        (int, int, int, str) - block_size, bch_poly, ecc_size, aes_mode
+
+    Raises:
+        ValueError - If the profile is unknown, malformed or its
+            BCH code does not cover the block size
+    '''
+    if profile in PROFILES:
+        return PROFILES[profile]
+    try:
+        block_size, bch_poly, ecc_size, aes_mode = profile.split(':')
+        params = (int(block_size), int(bch_poly), int(ecc_size),
+                  aes_mode.upper())
+    except ValueError:
+        raise ValueError(f'Unknown DOPE profile \'{profile}\'')
+    if params[3] not in AES_MODE_LOOKUP:
+        raise ValueError(f'Unknown AES mode \'{params[3]}\'')
+    if params[1] not in {x for x, _ in BCH_CODES}:
+        raise ValueError(f'Unknown BCH polynomial {params[1]}, use one of '
+                         + ', '.join(str(x) for x in
+                                     sorted({x for x, _ in BCH_CODES})))
+    if params[0] <= 4 or params[2] <= 0 or not bch_fits(*params[:3]):
+        raise ValueError(f'BCH code {params[1]}:{params[2]} does not cover '
+                         f'{params[0]} byte blocks')
+    return params
+
+
+def make_dope(password: bytes, profile: str = 'default') -> DOPE2:
+    '''
+    Fresh DOPE2 Key for a profile, the profile name goes in the key
+    '''
+    block_size, bch_poly, ecc_size, aes_mode = parse_profile(profile)
+    return DOPE2(password, bch_poly, ecc_size, aes_mode, b'',
+                 block_size=block_size,
+                 profile=profile_name(block_size, bch_poly, ecc_size,
+                                      aes_mode))
+
+
+def measure(block_size: int, bch_poly: int, ecc_size: int, aes_mode: str,
+            size: int = 1 << 18) -> dict:
+    '''
+    Throughput, CPU cost and expansion of one parameter set
+    Args:
+        block_size: int - DOPE Block Size
+        bch_poly: int - BCH Primitive Polynomial
+        ecc_size: int - Correctable bit errors per packet
+        aes_mode: str - Mode from AES_MODE_LOOKUP
+        size: int - Plaintext bytes per measurement
+
+    Returns:
+        dict - encode_mbps, decode_mbps, cpu_s_per_mb, expansion or error
+    '''
+    result = {
+        'profile': f'{block_size}:{bch_poly}:{ecc_size}:{aes_mode}',
+        'block_size': block_size,
+        'bch_poly': bch_poly,
+        'ecc_size': ecc_size,
+        'aes_mode': aes_mode
+    }
+    data = urandom(size)
+    try:
+        dopex = DOPE2(b'tune', bch_poly, ecc_size, aes_mode, b'',
+                      block_size=block_size)
+        dopex.fixate()
+        cpu, start = process_time(), perf_counter()
+        code = dopex.encode(data)
+        encode = perf_counter() - start
+        start = perf_counter()
+        if dopex.decode(code) != data:
+            raise ValueError('Round trip mismatch')
+        decode = perf_counter() - start
+        cpu = process_time() - cpu
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        return result
+    result.update({
+        'encode_mbps': size / encode / 1E6,
+        'decode_mbps': size / decode / 1E6,
+        'cpu_s_per_mb': cpu / (size / 1E6),
+        'expansion': len(code) / size
+    })
+    return result
+
+
+def tune(block_sizes: tuple = (512, 1024, 2048), codes: tuple = BCH_CODES,
+         aes_modes: tuple = tuple(AES_MODE_LOOKUP),
+         size: int = 1 << 18) -> dict:
+    '''
+    Benchmark every combination of block size, BCH code and AES mode
+    Args:
+        block_sizes: tuple - DOPE Block Sizes
+        codes: tuple - (bch_poly, ecc_size) pairs
+        aes_modes: tuple - AES Modes
+        size: int - Plaintext bytes per measurement
+
+    Returns:
+        dict - 'results' per combination, best first, and the
+            'recommended' AEAD profile with the most MB/s per
+            unit of expansion
+    '''
+    results = [measure(block_size, bch_poly, ecc_size, aes_mode, size)
+               for block_size in block_sizes
+               for bch_poly, ecc_size in codes
+               for aes_mode in aes_modes
+               if bch_fits(block_size, bch_poly, ecc_size)]
+
+    def score(item):
+        rate = 2 / (1 / item['encode_mbps'] + 1 / item['decode_mbps'])
+        return rate / item['expansion']
+
+    working = sorted([x for x in results if 'error' not in x],
+                     key=score, reverse=True)
+    for item in working:
+        item['score'] = score(item)
+    aead = [x for x in working if x['aes_mode'] in AEAD_MODES]
+    return {
+        'results': working + [x for x in results if 'error' in x],
+        'recommended': aead[0]['profile'] if aead else None
+    }
@@ -0,0 +1,173 @@
+'''
+SQLiteFS Write-back Buffer
+
+
+MIT License
+
+Copyright (c) 2021 Anubhav Mattoo
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+import threading
+from collections import OrderedDict
+
+
+class WriteBack(object):
+    """
+    Write-back Buffer
+    Coalesces writes into plaintext blocks per file so a block is
+    encrypted once when it leaves the buffer, not once per write
+    Parameters:-
+        spill: callable - spill(file_id, {block: bytes}) stores blocks
+        budget: int - Dirty bytes before the oldest files are spilled
+        limit: int - Dirty bytes before writers are throttled
+    """
+    def __init__(self, spill, budget: int = 1 << 26, limit: int = None):
+        self.spill = spill
+        self.budget = budget
+        self.limit = limit if limit is not None else 2 * budget
+        self.files = OrderedDict()
+        self.flight = {}
+        self.dirty = 0
+        self.spills = 0
+        self.throttled = 0
+        self.__spilling = False
+        self.__cond = threading.Condition()
+
+    def get(self, file_id, block: int) -> bytearray:
+        '''
+        Buffered block, None if the block is clean
+        '''
+        with self.__cond:
+            for table in (self.files, self.flight):
+                if file_id in table and block in table[file_id]:
+                    return table[file_id][block]
+        return None
+
+    def put(self, file_id, block: int, data: bytearray):
+        '''
+        Buffer a dirty block
+        '''
+        with self.__cond:
+            blocks = self.files.setdefault(file_id, {})
+            self.dirty += len(data) - len(blocks.get(block, b''))
+            blocks[block] = data
+            self.files.move_to_end(file_id)
+
+    def drop(self, file_id, start: int = 0, end: int = None):
+        '''
+        Discard dirty blocks in [start, end), a running spill of the
+        file is waited for so it cannot land after the discard
+        '''
+        with self.__cond:
+            while file_id in self.flight:
+                self.__cond.wait()
+            blocks = self.files.get(file_id, {})
+            for block in [x for x in blocks
+                          if x >= start and (end is None or x < end)]:
+                self.dirty -= len(blocks.pop(block))
+            if not blocks:
+                self.files.pop(file_id, None)
+            self.__cond.notify_all()
+
+    def flush(self, file_id):
+        '''
+        Spill one file, including a spill of it already running,
+        the blocks stay readable in flight until their rows are written
+        '''
+        with self.__cond:
+            while file_id in self.flight:
+                self.__cond.wait()
+            blocks = self.files.pop(file_id, None)
+            if not blocks:
+                return
+            self.flight[file_id] = blocks
+        stored = False
+        try:
+            self.spill(file_id, blocks)
+            stored = True
+        finally:
+            self.land([file_id], stored)
+
+    def flush_all(self):
+        '''
+        Spill every file
+        '''
+        for file_id in list(self.files):
+            self.flush(file_id)
+
+    def balance(self):
+        '''
+        Spill the least recently written files while over budget,
+        writers over the limit wait for running spills
+        '''
+        with self.__cond:
+            while self.dirty > self.limit and self.__spilling:
+                self.throttled += 1
+                self.__cond.wait()
+            if self.dirty <= self.budget or self.__spilling:
+                return
+            self.__spilling = True
+            size = self.dirty
+            batch = []
+            while size > self.budget and self.files:
+                file_id, blocks = self.files.popitem(last=False)
+                self.flight[file_id] = blocks
+                batch.append(file_id)
+                size -= sum(len(x) for x in blocks.values())
+        stored = []
+        try:
+            for file_id in batch:
+                self.spill(file_id, self.flight[file_id])
+                stored.append(file_id)
+                self.spills += 1
+        finally:
+            self.land(stored, True)
+            self.land([x for x in batch if x not in stored], False)
+            with self.__cond:
+                self.__spilling = False
+                self.__cond.notify_all()
+
+    def land(self, file_ids: list, stored: bool):
+        '''
+        Take spilled files out of flight, blocks of a failed spill
+        go back under any newer writes
+        '''
+        with self.__cond:
+            for file_id in file_ids:
+                blocks = self.flight.pop(file_id)
+                if stored:
+                    self.dirty -= sum(len(x) for x in blocks.values())
+                    continue
+                newer = self.files.pop(file_id, {})
+                for block, data in newer.items():
+                    self.dirty -= len(blocks.get(block, b''))
+                blocks.update(newer)
+                self.files[file_id] = blocks
+            self.__cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            'dirty_bytes': self.dirty,
+            'files': len(self.files),
+            'spills': self.spills,
+            'throttled': self.throttled
+        }
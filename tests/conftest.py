@@ -0,0 +1,14 @@
+import os
+import pytest
+from sqlitefs.litefs import SecFS
+
+
+@pytest.fixture
+def fs(tmp_path, monkeypatch):
+    '''
+    Unmounted SecFS on a scratch volume
+    '''
+    monkeypatch.chdir(tmp_path)
+    volume = SecFS('test', b'test', 'test', size=1E8)
+    yield volume
+    volume.destroy()
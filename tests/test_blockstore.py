@@ -0,0 +1,71 @@
+from sqlitefs.coreutils import REGF
+from sqlitefs.storage import Storage
+from sqlitefs.blockstore import BlockStore, keyed_fingerprint, BLOCK_SIZE
+
+A, B = b'a' * BLOCK_SIZE, b'b' * BLOCK_SIZE
+
+
+def refs(store, data):
+    return store.db.get(store.refs_key(store.fingerprint(data)))
+
+
+def shared(db):
+    return sorted(x for x in db.keys() if x.startswith('dedup:') and
+                  x != BlockStore.STATS)
+
+
+def test_dedup_counts_references(tmp_path):
+    db = Storage(str(tmp_path / 'test.db'), 'test')
+    store = BlockStore(db, keyed_fingerprint(b'k' * 32))
+    encoded = []
+
+    def encode(data):
+        encoded.append(data)
+        return b'E' + data
+
+    assert store.store(1, {0: A, 1: A, 2: B}, encode) == 2 * (BLOCK_SIZE + 1)
+    assert (refs(store, A), refs(store, B)) == (2, 1)
+    assert store.get(1, 1) == b'E' + A
+    # Overwriting a block moves its reference
+    store.store(1, {0: B}, encode)
+    assert (refs(store, A), refs(store, B)) == (1, 2)
+    # A second file reuses the shared block without encrypting it
+    assert store.store(2, {0: A}, encode) == 0
+    assert len(encoded) == 2
+    assert refs(store, A) == 2
+    store.drop(1, 0, 3)
+    assert (refs(store, A), refs(store, B)) == (1, None)
+    assert store.get(2, 0) == b'E' + A
+    db.commit()
+    db.close()
+    db = Storage(str(tmp_path / 'test.db'), 'test')
+    store = BlockStore(db, keyed_fingerprint(b'k' * 32))
+    assert store.stats()['logical_blocks'] == 1
+    assert store.stats()['unique_blocks'] == 1
+    store.drop(2, 0, 1)
+    assert shared(db) == []
+    assert store.stats()['unique_blocks'] == 0
+    db.close()
+
+
+def test_dedup_refs_survive_unlink_and_remount(tmp_path, monkeypatch):
+    from sqlitefs.litefs import SecFS
+    monkeypatch.chdir(tmp_path)
+    fs = SecFS('dedup', b'test', 'test', size=1E8, dedup=True)
+    for name in ('/a', '/b'):
+        fs.create(name, REGF | 0o644)
+        fs.write(name, A + B + A, 0, 0)
+        fs.flush(name, 0)
+    assert fs.statfs('/')['unique_blocks'] == 2
+    assert fs.statfs('/')['logical_blocks'] == 6
+    fs.unlink('/a')
+    fs.destroy()
+    fs = SecFS('dedup', b'test', 'test', dedup=True)
+    try:
+        assert fs.statfs('/')['logical_blocks'] == 3
+        assert fs.statfs('/')['unique_blocks'] == 2
+        assert fs.read('/b', 4 * BLOCK_SIZE, 0, 0) == A + B + A
+        fs.unlink('/b')
+        assert shared(fs.db) == []
+    finally:
+        fs.destroy()
@@ -0,0 +1,151 @@
+import os
+import random
+import threading
+from sqlitefs.coreutils import REGF
+from sqlitefs.litefs import SecFS
+from sqlitefs.blockstore import BLOCK_SIZE, block_count
+
+THREADS = 8
+ROUNDS = 200
+
+
+def space(size):
+    sign, size = (1, size) if size >= 0 else (-1, -size)
+    return sign * (size // 512)
+
+
+def held(holes, start, end):
+    '''
+    Bytes of [start, end) outside the hole blocks, the space they took
+    '''
+    return sum(min((x + 1) * BLOCK_SIZE, end) - max(x * BLOCK_SIZE, start)
+               for x in range(start // BLOCK_SIZE, block_count(end))
+               if x not in holes)
+
+
+def hammer(fs, i, model, shared, errors):
+    '''
+    Random operations on the files of one thread, its model follows
+    with the hole blocks of every file
+    '''
+    rnd = random.Random(i)
+    base = f'/t{i}'
+    delta = 0
+    holes = {}
+    fs.mkdir(base, 0o755)
+    try:
+        for _ in range(ROUNDS):
+            op = rnd.random()
+            names = sorted(model)
+            name = rnd.choice(names) if names else None
+            if name is None or op < 0.1:
+                name = f'{base}/f{rnd.randrange(1 << 20)}'
+                fs.create(name, REGF | 0o644)
+                model[name] = bytearray()
+                holes[name] = set()
+            elif op < 0.45:
+                offset = rnd.randrange(0, 3 * 4096)
+                data = os.urandom(rnd.randrange(1, 6000))
+                fs.write(name, data, offset, 0)
+                buff = model[name]
+                first = offset // BLOCK_SIZE
+                holes[name].update(range(block_count(len(buff)), first))
+                holes[name].difference_update(range(
+                    first, block_count(offset + len(data))))
+                buff.extend(bytes(max(0, offset - len(buff))))
+                buff[offset:offset + len(data)] = data
+                delta -= space(len(data))
+            elif op < 0.55:
+                length = rnd.randrange(0, 4 * 4096)
+                fs.truncate(name, length)
+                buff = model[name]
+                if length < len(buff):
+                    delta += space(held(holes[name], length, len(buff)))
+                    holes[name] = {x for x in holes[name]
+                                   if x < block_count(length)}
+                else:
+                    holes[name].update(range(block_count(len(buff)),
+                                             block_count(length)))
+                del buff[length:]
+                buff.extend(bytes(length - len(buff)))
+            elif op < 0.7:
+                offset = rnd.randrange(0, 4 * 4096)
+                if fs.read(name, 5000, offset, 0) !=\
+                        bytes(model[name][offset:offset + 5000]):
+                    errors.append(f'read {name}')
+            elif op < 0.77:
+                new = f'{base}/f{rnd.randrange(1 << 20)}'
+                if new not in model:
+                    fs.rename(name, new)
+                    model[new] = model.pop(name)
+                    holes[new] = holes.pop(name)
+            elif op < 0.82:
+                fs.unlink(name)
+                delta += space(held(holes.pop(name), 0,
+                                    len(model.pop(name))))
+            elif op < 0.9:
+                offset = rnd.randrange(0, len(shared))
+                if fs.read('/shared', 4096, offset, 0) !=\
+                        shared[offset:offset + 4096]:
+                    errors.append('read /shared')
+                fs.readdir('/', 0)
+            elif op < 0.95:
+                fs.chmod(name, REGF | 0o600)
+                fs.getattr(name)
+            else:
+                fs.flush(name, 0)
+                fs.fsync(name, 0, 0)
+    except Exception as e:
+        errors.append(f'{type(e).__name__}: {e}')
+    return delta
+
+
+def check(fs, models, bfree):
+    for i, model in enumerate(models):
+        listed = {f'/t{i}/{x}' for x in fs.readdir(f'/t{i}', 0)[2:]}
+        assert listed == set(model)
+        for name, buff in model.items():
+            assert fs.getattr(name)['st_size'] == len(buff)
+            assert fs.read(name, len(buff) + 1, 0, 0) == buff
+    assert fs.statfs('/')['f_bfree'] == bfree
+
+
+def test_threads_keep_data_namespace_and_statfs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fs = SecFS('stress', b'stress', 'stress', size=1E8,
+               dirty_budget=1 << 18, cache_size=1 << 18, readahead=4,
+               commit_interval=0.01)
+    fs.init('/')
+    shared = os.urandom(3 * 4096 + 17)
+    fs.create('/shared', REGF | 0o644)
+    fs.write('/shared', shared, 0, 0)
+    fs.flush('/shared', 0)
+    bfree = fs.statfs('/')['f_bfree']
+    models = [{} for _ in range(THREADS)]
+    deltas = [0] * THREADS
+    errors = []
+
+    def worker(i):
+        deltas[i] = hammer(fs, i, models[i], shared, errors)
+
+    pool = [threading.Thread(target=worker, args=(x,))
+            for x in range(THREADS)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    assert errors == []
+    check(fs, models, bfree + sum(deltas))
+    for name in [x for model in models for x in model]:
+        fs.flush(name, 0)
+    fs.fsync('/', 0, 0)
+    # Crash after the last sync, the journal replays the same tree
+    fs.readahead.shutdown()
+    fs.flusher.stop()
+    fs.journal.stop()
+    fs.db.close()
+    fs = SecFS('stress', b'stress', 'stress')
+    try:
+        check(fs, models, bfree + sum(deltas))
+    finally:
+        fs.destroy()
@@ -0,0 +1,60 @@
+import os
+import pytest
+from sqlitefs.dope import DOPE2, CONTAINER, DOPE_FORMAT_VERSION
+from sqlitefs.bench import to_legacy
+
+MODES = [{}, {'checkpoint': 4}, {'ratchet_mode': 'BLAKEIDX',
+                                  'executor': 'thread'}]
+
+
+def dope(**kwargs):
+    return DOPE2(b'test', 8219, 32, 'GCM', b'', block_size=512, **kwargs)
+
+
+def remount(dopex):
+    '''
+    The same key as a mount marshalls it
+    '''
+    return DOPE2.marshall(dopex.serialize(), b'test')
+
+
+@pytest.mark.parametrize('kwargs', MODES)
+@pytest.mark.parametrize('size', [1, 508, 509, 508 * 13 + 7])
+def test_container_round_trip(kwargs, size):
+    data = os.urandom(size)
+    dopex = dope(**kwargs)
+    code = dopex.encode(data)
+    magic, _, version, _, count, _ = CONTAINER.unpack_from(code)
+    assert (magic, version) == (b'DOPE', DOPE_FORMAT_VERSION)
+    assert count == -(-size // 508)
+    assert remount(dopex).decode(code) == data
+
+
+@pytest.mark.parametrize('kwargs', MODES)
+def test_container_decodes_block_ranges(kwargs):
+    data = os.urandom(508 * 13 + 7)
+    dopex = dope(**kwargs)
+    code = dopex.encode(data)
+    for start, end in [(0, 1), (3, 7), (4, 8), (9, 14)]:
+        assert remount(dopex).decode(code, start, end) ==\
+            data[start * 508:end * 508]
+
+
+def test_truncated_container_is_rejected():
+    dopex = dope()
+    code = dopex.encode(os.urandom(508 * 3))
+    with pytest.raises(ValueError):
+        dopex.decode(code[:-1])
+
+
+def test_convert_legacy_container():
+    data = os.urandom(508 * 5 + 3)
+    dopex = dope()
+    legacy = to_legacy(dopex, dopex.encode(data))
+    assert legacy[:4] != b'DOPE'
+    assert remount(dopex).decode(legacy) == data
+    assert remount(dopex).decode(legacy, 2, 4) == data[2 * 508:4 * 508]
+    converted = remount(dopex).convert(legacy)
+    assert converted[:4] == b'DOPE'
+    assert remount(dopex).decode(converted) == data
+    assert dopex.convert(converted) is converted
@@ -0,0 +1,85 @@
+import threading
+import time
+from sqlitefs.flusher import Flusher
+
+
+def test_failed_commit_raises_in_every_waiter():
+    gate = threading.Event()
+    calls = []
+
+    def commit():
+        calls.append(1)
+        if len(calls) == 1:
+            gate.wait(5)
+        elif len(calls) == 2:
+            raise IOError('disk full')
+
+    flusher = Flusher(commit, interval=60, limit=1)
+    flusher.start()
+    flusher.dirty(1)
+    while flusher.started < 1:
+        time.sleep(0.001)
+    results = []
+
+    def sync():
+        try:
+            flusher.sync()
+            results.append(None)
+        except IOError as e:
+            results.append(e)
+
+    waiters = [threading.Thread(target=sync) for _ in range(4)]
+    for x in waiters:
+        x.start()
+    while flusher.waiters < 4:
+        time.sleep(0.001)
+    gate.set()
+    for x in waiters:
+        x.join(5)
+    assert len(results) == 4
+    assert all(isinstance(x, IOError) for x in results)
+    flusher.sync()
+    flusher.stop()
+
+
+def test_later_failure_spares_a_committed_waiter():
+    gate = threading.Event()
+    calls = []
+
+    def commit():
+        calls.append(threading.current_thread().name)
+        if calls[-1] == 'group-commit':
+            gate.wait(5)
+        elif len(calls) == 3:
+            raise IOError('disk full')
+
+    flusher = Flusher(commit, interval=60, limit=1)
+    flusher.start()
+    # Generation 1 holds the background thread
+    flusher.dirty(1)
+    while flusher.started < 1:
+        time.sleep(0.001)
+    results = []
+
+    def sync():
+        try:
+            flusher.sync()
+            results.append(None)
+        except IOError as e:
+            results.append(e)
+
+    waiter = threading.Thread(target=sync)
+    waiter.start()
+    while flusher.waiters < 1:
+        time.sleep(0.001)
+    # Generation 2 commits the waiter, generation 3 fails before it wakes
+    with flusher._Flusher__cond:
+        flusher.flush()
+        try:
+            flusher.flush()
+        except IOError:
+            pass
+    waiter.join(5)
+    assert results == [None]
+    gate.set()
+    flusher.stop()
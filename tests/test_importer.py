@@ -0,0 +1,47 @@
+import os
+import pytest
+from sqlitefs.importer import Importer
+from sqlitefs.blockstore import BLOCK_SIZE
+
+
+def test_interrupted_import_keeps_the_committed_prefix(fs, tmp_path):
+    source = tmp_path / 'source'
+    source.mkdir()
+    data = os.urandom(4 * BLOCK_SIZE)
+    (source / 'big').write_bytes(data)
+    free = fs.statfs('/')['f_bavail']
+    importer = Importer(fs, b'test', workers=1, executor='thread',
+                        batch=1, job=1)
+    seen = []
+
+    def progress(size):
+        # Interrupted while storing the last job, after a batch commit
+        seen.append(size)
+        if len(seen) == 4:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        importer.run(str(source), '/', progress)
+    fs.db.close()
+    fs.__init__('test', b'test', 'test')
+    size = fs.getattr('/big')['st_size']
+    assert size == 3 * BLOCK_SIZE
+    assert fs.read('/big', 4 * BLOCK_SIZE, 0, 0) == data[:size]
+    assert fs.statfs('/')['f_bavail'] == free - size // 512
+    file_id = fs.dcache.lookup('/big', fs.FS)[0x7E]
+    assert [fs.blocks.get(file_id, x) is not None for x in range(4)] ==\
+        [True, True, True, False]
+
+
+def test_import_takes_space_for_data_not_holes(fs, tmp_path):
+    source = tmp_path / 'source'
+    source.mkdir()
+    data = os.urandom(BLOCK_SIZE) + bytes(8 * BLOCK_SIZE) + b'tail'
+    (source / 'sparse').write_bytes(data)
+    free = fs.statfs('/')['f_bfree']
+    Importer(fs, b'test', workers=1, executor='thread', job=4).run(
+        str(source), '/')
+    assert fs.read('/sparse', len(data) + 1, 0, 0) == data
+    assert fs.statfs('/')['f_bfree'] == free - (BLOCK_SIZE + 4) // 512
+    fs.unlink('/sparse')
+    assert fs.statfs('/')['f_bfree'] == free
@@ -0,0 +1,49 @@
+import threading
+from time import sleep
+from sqlitefs.dope import DOPE2
+from sqlitefs.coreutils import REGF
+
+
+def test_checkpoint_encrypts_outside_the_tree_lock(fs, monkeypatch):
+    fs.mkdir('/before', 0o755)
+    fs.group_commit()
+    entered, gate = threading.Event(), threading.Event()
+    encode = DOPE2.encode
+
+    def slow(self, data):
+        if threading.current_thread().name == 'checkpoint':
+            entered.set()
+            gate.wait(5)
+        return encode(self, data)
+
+    monkeypatch.setattr(DOPE2, 'encode', slow)
+    folding = threading.Thread(target=fs.journal.checkpoint,
+                               name='checkpoint')
+    folding.start()
+    assert entered.wait(5)
+    # The namespace is writable while the snapshot is encrypted
+    fs.mkdir('/during', 0o755)
+    assert folding.is_alive()
+    gate.set()
+    folding.join(5)
+    fs.group_commit()
+    fs.db.close()
+    fs.__init__('test', b'test', 'test')
+    assert {'before', 'during'} <= set(fs.readdir('/', 0))
+
+
+def test_metadata_changes_commit_within_the_interval(fs):
+    fs.flusher.interval = 0.05
+    fs.init('/')
+    fs.mkdir('/d', 0o755)
+    fs.create('/d/f', REGF | 0o644)
+    fs.chmod('/d/f', REGF | 0o600)
+    sleep(0.5)
+    # Crash, the threads stop without a final commit
+    fs.flusher.commit = lambda: None
+    fs.readahead.shutdown()
+    fs.flusher.stop()
+    fs.journal.stop()
+    fs.db.close()
+    fs.__init__('test', b'test', 'test')
+    assert fs.getattr('/d/f')['st_mode'] == REGF | 0o600
@@ -0,0 +1,128 @@
+from sqlitefs.coreutils import REGF, FALLOC_FL_PUNCH_HOLE, FALLOC_FL_KEEP_SIZE
+from sqlitefs.blockstore import BLOCK_SIZE
+
+
+def rows(fs, file_id):
+    return [x for x in fs.db.keys() if x.startswith(f'{file_id}:')]
+
+
+def test_rename_over_file_drops_target_blocks(fs):
+    fs.create('/a', REGF | 0o644)
+    fs.create('/b', REGF | 0o644)
+    fs.write('/a', b'a' * BLOCK_SIZE, 0, 0)
+    fs.write('/b', b'b' * 3 * BLOCK_SIZE, 0, 0)
+    fs.fsync('/a', 0, 0)
+    fs.fsync('/b', 0, 0)
+    target = fs.FS['']['b'][0x7E]
+    assert len(rows(fs, target)) == 3
+    free = fs.statfs('/')['f_bfree']
+    fs.rename('/a', '/b')
+    assert rows(fs, target) == []
+    assert fs.statfs('/')['f_bfree'] - free == 3 * BLOCK_SIZE // 512
+    assert fs.read('/b', BLOCK_SIZE, 0, 0) == b'a' * BLOCK_SIZE
+
+
+def test_rename_over_file_releases_dedup_refs(tmp_path, monkeypatch):
+    from sqlitefs.litefs import SecFS
+    monkeypatch.chdir(tmp_path)
+    fs = SecFS('dedup', b'test', 'test', size=1E8, dedup=True)
+    try:
+        fs.create('/a', REGF | 0o644)
+        fs.create('/b', REGF | 0o644)
+        fs.write('/a', b'x' * BLOCK_SIZE, 0, 0)
+        fs.write('/b', b'y' * 2 * BLOCK_SIZE, 0, 0)
+        fs.fsync('/a', 0, 0)
+        fs.fsync('/b', 0, 0)
+        fs.rename('/a', '/b')
+        assert fs.blocks.stats()['logical_blocks'] == 1
+        assert fs.blocks.stats()['unique_blocks'] == 1
+    finally:
+        fs.destroy()
+
+
+def test_rename_over_buffered_file(fs):
+    fs.create('/a', REGF | 0o644)
+    fs.create('/b', REGF | 0o644)
+    fs.write('/a', b'new', 0, 0)
+    fs.write('/b', b'old' * 1000, 0, 0)
+    target = fs.FS['']['b'][0x7E]
+    fs.rename('/a', '/b')
+    fs.writeback.flush_all()
+    assert rows(fs, target) == []
+    assert fs.read('/b', 100, 0, 0) == b'new'
+
+
+def test_release_closes_handle(fs):
+    fh = fs.create('/a', REGF | 0o644)
+    assert fs.release('/a', fh) == 0
+
+
+def test_prefetch_does_not_cache_block_written_during_fetch(fs):
+    fs.create('/a', REGF | 0o644)
+    fs.write('/a', b'old' * 2000, 0, 0)
+    fs.fsync('/a', 0, 0)
+    inode = fs.FS['']['a']
+    lookup = fs.writeback.get
+
+    def racing(file_id, block):
+        # A write lands and is spilled right after the
+        # prefetch found the block clean
+        fs.writeback.get = lookup
+        data = lookup(file_id, block)
+        fs.write('/a', b'new', 0, 0)
+        fs.writeback.flush(file_id)
+        return data
+
+    fs.writeback.get = racing
+    fetch = fs.blocks.get
+    stale = fetch(inode[0x7E], 0)
+    fs.blocks.get = lambda file_id, block: stale
+    with fs.keyring.codec() as dopex:
+        fs.load_block(inode, 0, dopex)
+    fs.blocks.get = fetch
+    assert fs.read('/a', 3, 0, 0) == b'new'
+
+
+def test_sparse_file_gives_back_only_what_it_took(fs):
+    free = fs.statfs('/')['f_bfree']
+    fs.create('/s', REGF | 0o644)
+    fs.write('/s', b'x' * BLOCK_SIZE, 0, 0)
+    fs.truncate('/s', 1 << 37)
+    assert fs.statfs('/')['f_bfree'] == free - BLOCK_SIZE // 512
+    fs.write('/s', b'y' * BLOCK_SIZE, 1 << 36, 0)
+    fs.truncate('/s', (1 << 36) + BLOCK_SIZE)
+    assert fs.statfs('/')['f_bfree'] == free - 2 * BLOCK_SIZE // 512
+    fs.truncate('/s', (1 << 36) + 1024)
+    assert fs.statfs('/')['f_bfree'] == free - (BLOCK_SIZE + 1024) // 512
+    fs.unlink('/s')
+    assert fs.statfs('/')['f_bfree'] == free
+
+
+def test_holes_read_as_zeros_and_survive_remount(fs):
+    data = bytearray(b'd' * 3 * BLOCK_SIZE)
+    fs.create('/h', REGF | 0o644)
+    fs.write('/h', bytes(data), 0, 0)
+    fs.truncate('/h', 10 * BLOCK_SIZE)
+    data.extend(bytes(7 * BLOCK_SIZE))
+    fs.write('/h', b'm' * 10, 6 * BLOCK_SIZE + 5, 0)
+    data[6 * BLOCK_SIZE + 5:6 * BLOCK_SIZE + 15] = b'm' * 10
+    fs.fallocate('/h', FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE,
+                 BLOCK_SIZE - 1, BLOCK_SIZE + 2)
+    data[BLOCK_SIZE - 1:2 * BLOCK_SIZE + 1] = bytes(BLOCK_SIZE + 2)
+    fs.flush('/h', 0)
+    file_id = fs.FS['']['h'][0x7E]
+    assert fs.FS['']['h'][0x7D] == [(1, 2), (3, 6), (7, 10)]
+    assert len(rows(fs, file_id)) == 3
+    assert fs.read('/h', len(data) + 1, 0, 0) == data
+    # Shrinking into a hole then growing again reads zeros
+    fs.truncate('/h', 4 * BLOCK_SIZE + 7)
+    fs.truncate('/h', 8 * BLOCK_SIZE)
+    del data[4 * BLOCK_SIZE + 7:]
+    data.extend(bytes(8 * BLOCK_SIZE - len(data)))
+    assert fs.read('/h', len(data) + 1, 0, 0) == data
+    fs.destroy()
+    fs.__init__('test', b'test', 'test')
+    assert fs.FS['']['h'][0x7D] == [(1, 2), (3, 8)]
+    assert fs.getattr('/h')['st_size'] == len(data)
+    assert fs.read('/h', len(data) + 1, 0, 0) == data
+    assert len(rows(fs, file_id)) == 2
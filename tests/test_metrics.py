@@ -0,0 +1,37 @@
+import pytest
+from sqlitefs.coreutils import REGF
+
+
+def test_failed_write_is_counted_as_error(fs):
+    with pytest.raises(Exception) as info:
+        fs('write', '/nope', b'data', 0, 0)
+    assert not isinstance(info.value, TypeError)
+    item = fs.metrics.ops['write']
+    assert (item.count, item.errors, item.bytes) == (1, 1, 0)
+
+
+def test_failed_read_counts_no_bytes(fs):
+    with pytest.raises(Exception):
+        fs('read', '/nope', 10, 0, 0)
+    item = fs.metrics.ops['read']
+    assert (item.errors, item.bytes) == (1, 0)
+
+
+def test_read_and_write_bytes(fs):
+    fs('create', '/a', REGF | 0o644)
+    assert fs('write', '/a', b'data', 0, 0) == 4
+    assert fs('read', '/a', 10, 0, 0) == b'data'
+    assert fs.metrics.ops['write'].bytes == 4
+    assert fs.metrics.ops['read'].bytes == 4
+
+
+def test_stats_file_size_matches_served_view(fs):
+    from sqlitefs.metrics import STATS_FILE
+    size = fs('getattr', STATS_FILE)['st_size']
+    for x in range(50):
+        fs('getattr', '/')
+    fh = fs('open', STATS_FILE, 0)
+    data = fs('read', STATS_FILE, 1 << 20, 0, fh)
+    assert len(data) == size
+    assert fs('getattr', STATS_FILE, fh)['st_size'] == size
+    fs('release', STATS_FILE, fh)
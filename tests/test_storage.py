@@ -0,0 +1,37 @@
+import pickle
+import sqlite3
+from sqlitefs.storage import Storage, FETCH_CHUNK, MIGRATE_CHUNK
+
+
+def test_fetch_reads_keys_in_chunks(tmp_path):
+    db = Storage(str(tmp_path / 'test.db'), 'test', readers=1)
+    count = 2 * FETCH_CHUNK + 7
+    db.put_many({f'k{x}': bytes([x % 256]) for x in range(0, count, 2)})
+    db.commit()
+    statements = []
+    conn = db.reader()
+    conn.set_trace_callback(statements.append)
+    db.release(conn)
+    keys = [f'k{x}' for x in range(count)]
+    assert db.get_many(keys) ==\
+        {f'k{x}': bytes([x % 256]) for x in range(0, count, 2)}
+    assert len(statements) == 3
+    db.close()
+
+
+def test_migrate_moves_a_legacy_table_in_chunks(tmp_path):
+    filename = str(tmp_path / 'test.db')
+    conn = sqlite3.connect(filename)
+    conn.execute('CREATE TABLE "test" (key TEXT PRIMARY KEY, value BLOB)')
+    rows = {f'k{x}': {x: bytes([x % 256]) * 100}
+            for x in range(3 * MIGRATE_CHUNK + 1)}
+    conn.executemany('INSERT INTO "test" (key, value) VALUES (?, ?)',
+                     [(k, pickle.dumps(v)) for k, v in rows.items()])
+    conn.commit()
+    conn.close()
+    db = Storage(filename, 'test')
+    assert db.get_many(list(rows)) == rows
+    assert db.writer.execute(
+        'SELECT name FROM sqlite_master WHERE name = \'test\'').fetchone()\
+        is None
+    db.close()
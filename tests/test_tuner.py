@@ -0,0 +1,18 @@
+import pytest
+from sqlitefs.tuner import parse_profile, PROFILES
+
+
+def test_parse_profile_accepts_presets_and_specs():
+    assert parse_profile('balanced') == PROFILES['balanced']
+    assert parse_profile('1024:16427:16:gcm') == (1024, 16427, 16, 'GCM')
+
+
+@pytest.mark.parametrize('profile', [
+    'fast', '512:8219:GCM', '512:8219:32:XTS',
+    # A polynomial bchlib cannot build, and parity that does not fit
+    '512:8218:32:GCM', '512:8219:500:GCM', '4096:8219:32:GCM',
+    '4:8219:32:GCM'
+])
+def test_parse_profile_rejects_unusable_profiles(profile):
+    with pytest.raises(ValueError):
+        parse_profile(profile)
@@ -0,0 +1,31 @@
+import pytest
+from sqlitefs.writeback import WriteBack
+
+
+def test_flush_keeps_blocks_readable_until_stored():
+    seen = []
+
+    def spill(file_id, blocks):
+        seen.append(writeback.get(file_id, 0))
+
+    writeback = WriteBack(spill)
+    writeback.put(1, 0, bytearray(b'data'))
+    writeback.flush(1)
+    assert seen == [bytearray(b'data')]
+    assert writeback.get(1, 0) is None
+    assert writeback.dirty == 0
+
+
+def test_failed_flush_keeps_newer_writes():
+    def spill(file_id, blocks):
+        writeback.put(file_id, 1, bytearray(b'newer'))
+        raise IOError('disk full')
+
+    writeback = WriteBack(spill)
+    writeback.put(1, 0, bytearray(b'old'))
+    writeback.put(1, 1, bytearray(b'old'))
+    with pytest.raises(IOError):
+        writeback.flush(1)
+    assert writeback.get(1, 0) == bytearray(b'old')
+    assert writeback.get(1, 1) == bytearray(b'newer')
+    assert writeback.dirty == len(b'old') + len(b'newer')